@@ -531,6 +531,95 @@ class ChineseChess:
             
         return safety_score
 
+    # Piece values shared by the search helpers below (same as evaluate_piece_safety)
+    PIECE_VALUES = {
+        '將': 0, '帥': 0,
+        '車': 900,
+        '馬': 450,
+        '炮': 450,
+        '象': 200, '相': 200,
+        '士': 200, '仕': 200,
+        '卒': 100, '兵': 100
+    }
+
+    def _move_sorting_score(self, move):
+        """Preliminary move score so captures of valuable pieces are searched first"""
+        from_pos, to_pos = move
+        moving_piece = self.board[from_pos[0]][from_pos[1]]
+        target_piece = self.board[to_pos[0]][to_pos[1]]
+        if not target_piece:
+            return 0
+        # Most valuable victim first, cheapest attacker breaks ties
+        return self.PIECE_VALUES[target_piece[1]] * 10 - self.PIECE_VALUES[moving_piece[1]]
+
+    def evaluate_position(self):
+        """Static evaluation from black's (the AI's) point of view"""
+        score = 0
+        for row in range(10):
+            for col in range(9):
+                piece = self.board[row][col]
+                if piece:
+                    value = self.PIECE_VALUES[piece[1]]
+                    score += value if piece[0] == 'B' else -value
+        score += self.evaluate_king_safety('black') - self.evaluate_king_safety('red')
+        return score
+
+    def minimax(self, depth, alpha, beta, maximizing):
+        """
+        Alpha-beta search on self.board
+        Args:
+            depth: remaining plies to search
+            alpha, beta: current search window
+            maximizing: True when black (the AI) is to move
+        Returns:
+            score of the position from black's point of view
+        """
+        if depth == 0:
+            return self.evaluate_position()
+        
+        color = 'black' if maximizing else 'red'
+        moves = self.get_all_valid_moves(color)
+        moves.sort(key=self._move_sorting_score, reverse=True)
+        
+        best_score = float('-inf') if maximizing else float('inf')
+        has_legal_move = False
+        
+        for from_pos, to_pos in moves:
+            moving_piece = self.board[from_pos[0]][from_pos[1]]
+            captured_piece = self.board[to_pos[0]][to_pos[1]]
+            
+            # Make temporary move
+            self.board[to_pos[0]][to_pos[1]] = moving_piece
+            self.board[from_pos[0]][from_pos[1]] = None
+            
+            if self.is_in_check(color):
+                # Illegal: leaves own king in check
+                self.board[from_pos[0]][from_pos[1]] = moving_piece
+                self.board[to_pos[0]][to_pos[1]] = captured_piece
+                continue
+            
+            has_legal_move = True
+            score = self.minimax(depth - 1, alpha, beta, not maximizing)
+            
+            # Restore position
+            self.board[from_pos[0]][from_pos[1]] = moving_piece
+            self.board[to_pos[0]][to_pos[1]] = captured_piece
+            
+            if maximizing:
+                best_score = max(best_score, score)
+                alpha = max(alpha, score)
+            else:
+                best_score = min(best_score, score)
+                beta = min(beta, score)
+            if beta <= alpha:
+                break
+        
+        # No legal moves: checkmated (or stalemated, which also loses)
+        if not has_legal_move:
+            return -100000 - depth if maximizing else 100000 + depth
+        
+        return best_score
+
     def make_ai_move(self):
         import time
         
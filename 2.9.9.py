@@ -1,867 +1,70 @@
-import tkinter as tk
-from tkinter import messagebox
 import os
-import pygame.mixer
-import numpy as np
-import random
+import inspect
+import queue
+import threading
 
-import math
-import copy
-from collections import defaultdict
+from chess_engine import (
+    BoardRules, MCTS, TranspositionTable, AlphaBeta, LazySMP,
+    OpeningBook, EndgameTablebases, MoveHistory, GameState
+)
 
-class MCTSNode:
-        
-    def __init__(self, board, current_player, parent=None, move=None):
-        self.board = [row[:] for row in board]  # Only store the board
-        self.current_player = current_player    # Only store the current player
-        self.parent = parent
-        self.move = move
-        self.children = []
-        self.wins = 0
-        self.visits = 0
-        self.untried_moves = self.get_valid_moves()
-
-    def get_best_child(self, c=1.41, checkmate_weight=0.3):
-        best_score = float('-inf')
-        best_child = None
-        
-        for child in self.children:
-            # Standard UCT score
-            if child.visits == 0:
-                uct_score = float('inf')
-            else:
-                uct_score = (child.wins / child.visits) + \
-                           c * math.sqrt(math.log(self.visits) / child.visits)
-            
-            # Add checkmate potential score
-            checkmate_score = 0
-            if hasattr(child, 'board'):
-                # Check if move puts opponent in check
-                if child._is_in_check(child.current_player):
-                    checkmate_score += 0.5
-                    
-                # Check if move restricts opponent king's mobility
-                opponent_king_moves = self._count_king_moves(child.board, child.current_player)
-                checkmate_score += (8 - opponent_king_moves) * 0.1
-            
-            # Combine scores
-            total_score = uct_score + checkmate_weight * checkmate_score
-            
-            if total_score > best_score:
-                best_score = total_score
-                best_child = child
-                
-        return best_child
-
-    def _count_king_moves(self, board, player):
-        """Helper method to count available king moves"""
-        king_pos = None
-        # Find king position
-        for row in range(10):
-            for col in range(9):
-                piece = board[row][col]
-                if piece and piece[0] == player[0].upper() and piece[1] in ['帥', '將']:
-                    king_pos = (row, col)
-                    break
-            if king_pos:
-                break
-        
-        if not king_pos:
-            return 0
-            
-        # Count valid moves for king
-        valid_moves = 0
-        row, col = king_pos
-        for dr, dc in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-            new_row, new_col = row + dr, col + dc
-            # Check if move is valid (within palace and not blocked)
-            if self._is_valid_move((row, col), (new_row, new_col), check_for_check=False):
-                valid_moves += 1
-                
-        return valid_moves
-
-    def get_valid_moves(self):
-        moves = []
-        for row in range(10):
-            for col in range(9):
-                piece = self.board[row][col]
-                if piece and piece[0] == self.current_player[0].upper():
-                    for to_row in range(10):
-                        for to_col in range(9):
-                            if self._is_valid_move((row, col), (to_row, to_col)):
-                                moves.append(((row, col), (to_row, to_col)))
-        return moves
-
-    def _is_valid_move(self, from_pos, to_pos, check_for_check=True):
-        from_row, from_col = from_pos
-        to_row, to_col = to_pos
-        piece = self.board[from_row][from_col]
-        
-        # Basic validation
-        if not (0 <= to_row < 10 and 0 <= to_col < 9):
-            return False
-            
-        # Can't capture own pieces
-        if self.board[to_row][to_col] and self.board[to_row][to_col][0] == piece[0]:
-            return False
-        
-        # Get piece type
-        piece_type = piece[1]
-        
-        # Check specific piece movement rules
-        if piece_type == '帥' or piece_type == '將':  # General/King
-            # Check if move is within palace (3x3 grid)
-            if piece[0] == 'R':  # Red general
-                if not (7 <= to_row <= 9 and 3 <= to_col <= 5):
-                    return False
-            else:  # Black general
-                if not (0 <= to_row <= 2 and 3 <= to_col <= 5):
-                    return False
-            # Can only move one step horizontally or vertically
-            if abs(to_row - from_row) + abs(to_col - from_col) != 1:
-                return False
-                
-        elif piece_type == '仕' or piece_type == '士':  # Advisor
-            # Check if move is within palace
-            if piece[0] == 'R':  # Red advisor
-                if not (7 <= to_row <= 9 and 3 <= to_col <= 5):
-                    return False
-            else:  # Black advisor
-                if not (0 <= to_row <= 2 and 3 <= to_col <= 5):
-                    return False
-            # Must move exactly one step diagonally
-            if abs(to_row - from_row) != 1 or abs(to_col - from_col) != 1:
-                return False
-                
-        elif piece_type == '相' or piece_type == '象':  # Elephant
-            # Cannot cross river
-            if piece[0] == 'R':  # Red elephant
-                if to_row < 5:  # Cannot cross river
-                    return False
-            else:  # Black elephant
-                if to_row > 4:  # Cannot cross river
-                    return False
-            # Must move exactly two steps diagonally
-            if abs(to_row - from_row) != 2 or abs(to_col - from_col) != 2:
-                return False
-            # Check if there's a piece blocking the elephant's path
-            blocking_row = (from_row + to_row) // 2
-            blocking_col = (from_col + to_col) // 2
-            if self.board[blocking_row][blocking_col]:
-                return False
-                
-        elif piece_type == '馬':  # Horse
-            row_diff = abs(to_row - from_row)
-            col_diff = abs(to_col - from_col)
-            if not ((row_diff == 2 and col_diff == 1) or (row_diff == 1 and col_diff == 2)):
-                return False
-            # Check for blocking piece
-            if row_diff == 2:
-                blocking_row = from_row + (1 if to_row > from_row else -1)
-                if self.board[blocking_row][from_col]:
-                    return False
-            else:
-                blocking_col = from_col + (1 if to_col > from_col else -1)
-                if self.board[from_row][blocking_col]:
-                    return False
-                    
-        elif piece_type == '車':  # Chariot
-            if from_row != to_row and from_col != to_col:
-                return False
-            # Check if path is clear
-            if from_row == to_row:  # Horizontal move
-                start_col = min(from_col, to_col) + 1
-                end_col = max(from_col, to_col)
-                for col in range(start_col, end_col):
-                    if self.board[from_row][col]:
-                        return False
-            else:  # Vertical move
-                start_row = min(from_row, to_row) + 1
-                end_row = max(from_row, to_row)
-                for row in range(start_row, end_row):
-                    if self.board[row][from_col]:
-                        return False
-                        
-        elif piece_type == '炮':  # Cannon
-            if from_row != to_row and from_col != to_col:
-                return False
-            # Count pieces between from and to positions
-            pieces_between = 0
-            if from_row == to_row:  # Horizontal move
-                start_col = min(from_col, to_col) + 1
-                end_col = max(from_col, to_col)
-                for col in range(start_col, end_col):
-                    if self.board[from_row][col]:
-                        pieces_between += 1
-            else:  # Vertical move
-                start_row = min(from_row, to_row) + 1
-                end_row = max(from_row, to_row)
-                for row in range(start_row, end_row):
-                    if self.board[row][from_col]:
-                        pieces_between += 1
-            # If capturing, need exactly one piece between
-            if self.board[to_row][to_col]:
-                return pieces_between == 1
-            # If not capturing, path must be clear
-            return pieces_between == 0
-            
-        elif piece_type == '兵' or piece_type == '卒':  # Pawn
-            if piece[0] == 'R':  # Red pawn
-                # Before crossing river
-                if from_row > 4:
-                    # Can only move forward (up)
-                    return to_col == from_col and to_row == from_row - 1
-                # After crossing river
-                else:
-                    # Can move forward or sideways
-                    return (to_col == from_col and to_row == from_row - 1) or \
-                           (to_row == from_row and abs(to_col - from_col) == 1)
-            else:  # Black pawn
-                # Before crossing river
-                if from_row < 5:
-                    # Can only move forward (down)
-                    return to_col == from_col and to_row == from_row + 1
-                # After crossing river
-                else:
-                    # Can move forward or sideways
-                    return (to_col == from_col and to_row == from_row + 1) or \
-                           (to_row == from_row and abs(to_col - from_col) == 1)
-        
-        return True
-
-    def UCT_select_child(self):
-        # UCT formula for node selection
-        exploration_constant = 1.41  # Typical value for UCT
-        
-        best_score = float('-inf')
-        best_child = None
-        
-        for child in self.children:
-            if child.visits == 0:
-                score = float('inf')
-            else:
-                score = (child.wins / child.visits) + \
-                        exploration_constant * math.sqrt(math.log(self.visits) / child.visits)
-            
-            if score > best_score:
-                best_score = score
-                best_child = child
-                
-        return best_child
-
-    def _is_in_check(self, color):
-        """Check if the king of the given color is in check"""
-        red_king_pos, black_king_pos = self._find_kings()
-        
-        if not red_king_pos or not black_king_pos:
-            return False
-        
-        # First check the special case of facing generals
-        if self._is_generals_facing():
-            return True  # Both kings are in check in this case
-        
-        # Then check the normal cases of being under attack
-        if color == 'red':
-            return self._is_position_under_attack(red_king_pos, 'black')
-        else:
-            return self._is_position_under_attack(black_king_pos, 'red')
-
-    def _find_kings(self):
-        """Find positions of both kings/generals"""
-        red_king_pos = black_king_pos = None
-        for row in range(10):
-            for col in range(9):
-                piece = self.board[row][col]
-                if piece:
-                    if piece[1] == '帥':
-                        red_king_pos = (row, col)
-                    elif piece[1] == '將':
-                        black_king_pos = (row, col)
-        return red_king_pos, black_king_pos
-
-    def _is_position_under_attack(self, pos, attacking_color):
-        """Check if a position is under attack by pieces of the given color"""
-        target_row, target_col = pos
-        
-        # Check from all positions on the board
-        for row in range(10):
-            for col in range(9):
-                piece = self.board[row][col]
-                if piece and piece[0] == attacking_color[0].upper():
-                    # Check if this piece can move to the target position
-                    if self._is_valid_move((row, col), pos):
-                        return True
-        return False
-
-    def _is_generals_facing(self):
-        """Check if the two generals are facing each other directly"""
-        red_king_pos, black_king_pos = self._find_kings()
-        
-        # If either king is missing, return False
-        if not red_king_pos or not black_king_pos:
-            return False
-            
-        red_row, red_col = red_king_pos
-        black_row, black_col = black_king_pos
-        
-        # Check if generals are in the same column
-        if red_col != black_col:
-            return False
-            
-        # Check if there are any pieces between the generals
-        start_row = min(red_row, black_row) + 1
-        end_row = max(red_row, black_row)
-        
-        for row in range(start_row, end_row):
-            if self.board[row][red_col]:  # If there's any piece between
-                return False
-        
-        # If we get here, the generals are facing each other
-        return True
-
-
-class MCTS:
-
-    def __init__(self, game_state, simulation_limit=1000):
-        self.root = MCTSNode(
-            board=[row[:] for row in game_state.board],
-            current_player=game_state.current_player
-        )
-        self.simulation_limit = simulation_limit
-
-    def _is_valid_move(self, from_pos, to_pos, board):
-        """Implementation of move validation logic for a given board state"""
-        from_row, from_col = from_pos
-        to_row, to_col = to_pos
-        piece = board[from_row][from_col]
-        
-        # Basic validation
-        if not (0 <= to_row < 10 and 0 <= to_col < 9):
-            return False
-            
-        # Can't capture own pieces
-        if board[to_row][to_col] and board[to_row][to_col][0] == piece[0]:
-            return False
-        
-        # Get piece type
-        piece_type = piece[1]
-        
-        # Check specific piece movement rules
-        if piece_type in ['帥', '將']:  # General/King
-            # Check if move is within palace (3x3 grid)
-            if piece[0] == 'R':  # Red general
-                if not (7 <= to_row <= 9 and 3 <= to_col <= 5):
-                    return False
-            else:  # Black general
-                if not (0 <= to_row <= 2 and 3 <= to_col <= 5):
-                    return False
-            # Can only move one step horizontally or vertically
-            if abs(to_row - from_row) + abs(to_col - from_col) != 1:
-                return False
-        
-        # Add similar rules for other pieces...
-        
-        return True
+# tkinter, pygame.mixer and Pillow are imported by ChineseChess.load_ui_modules() when
+# the UI starts, so importing this file needs no display or audio device
+tk = None
+messagebox = None
+pygame = None
+Image = ImageDraw = ImageFont = ImageTk = None
 
-    def _is_in_check(self, color, board):
-        """Implementation of check detection for a given board state"""
-        # Find kings
-        red_king_pos = black_king_pos = None
-        for row in range(10):
-            for col in range(9):
-                piece = board[row][col]
-                if piece:
-                    if piece[1] == '帥':
-                        red_king_pos = (row, col)
-                    elif piece[1] == '將':
-                        black_king_pos = (row, col)
-        
-        if not red_king_pos or not black_king_pos:
-            return False
-        
-        # Check if kings are facing each other
-        if red_king_pos[1] == black_king_pos[1]:  # Same column
-            blocked = False
-            for row in range(red_king_pos[0] + 1, black_king_pos[0]):
-                if board[row][red_king_pos[1]]:
-                    blocked = True
-                    break
-            if not blocked:
-                return True
-        
-        # Check if king is under attack
-        king_pos = red_king_pos if color == 'red' else black_king_pos
-        attacking_color = 'B' if color == 'red' else 'R'
-        
-        for row in range(10):
-            for col in range(9):
-                piece = board[row][col]
-                if piece and piece[0] == attacking_color:
-                    if self._is_valid_move((row, col), king_pos, board):
-                        return True
-        
-        return False
+class PieceSprites:
 
-    def evaluate_move(self, move, board):
-        """
-        Evaluates a potential move
-        Args:
-            move: tuple ((from_row, from_col), (to_row, to_col))
-            board: current game board state
-        Returns:
-            score: numeric value representing move quality
-        """
-        score = 0
-        from_pos, to_pos = move
-        
-        # Create temporary board for evaluation
-        temp_board = [row[:] for row in board]
-        piece = temp_board[from_pos[0]][from_pos[1]]
-        temp_board[to_pos[0]][to_pos[1]] = piece
-        temp_board[from_pos[0]][from_pos[1]] = None
-        
-        # Check if move gives check
-        if self._move_gives_check(move, temp_board):
-            score += 50
-        
-        # Check if move restricts king mobility
-        if self._reduces_king_mobility(move, temp_board):
-            score += 20
-        
-        # Check if move controls key squares
-        if self._controls_key_squares(move, temp_board):
-            score += 15
-        
-        return score
-
-    def _move_gives_check(self, move, board):
-        """Helper to check if move puts opponent in check"""
-        from_pos, to_pos = move
-        temp_board = [row[:] for row in board]
-        piece = temp_board[from_pos[0]][from_pos[1]]
-        player = 'black' if piece[0] == 'B' else 'red'
-        opponent = 'red' if player == 'black' else 'black'
-        
-        # Make the move
-        temp_board[to_pos[0]][to_pos[1]] = piece
-        temp_board[from_pos[0]][from_pos[1]] = None
-        
-        # Find opponent's king
-        king_pos = None
-        king_symbol = '帥' if opponent == 'red' else '將'
-        for row in range(10):
-            for col in range(9):
-                if temp_board[row][col] and temp_board[row][col][1] == king_symbol:
-                    king_pos = (row, col)
-                    break
-            if king_pos:
-                break
-        
-        # Check if king is under attack
-        if king_pos:
-            for row in range(10):
-                for col in range(9):
-                    attacking_piece = temp_board[row][col]
-                    if attacking_piece and attacking_piece[0] == player[0].upper():
-                        if self.root._is_valid_move((row, col), king_pos, check_for_check=False):
-                            return True
-        return False
-
-    def _reduces_king_mobility(self, move, board):
-        """Helper to check if move reduces opponent king's mobility"""
-        from_pos, to_pos = move
-        temp_board = [row[:] for row in board]
-        piece = temp_board[from_pos[0]][from_pos[1]]
-        opponent = 'red' if piece[0] == 'B' else 'black'
-        
-        # Find opponent's king
-        king_pos = None
-        king_symbol = '帥' if opponent == 'red' else '將'
-        for row in range(10):
-            for col in range(9):
-                if temp_board[row][col] and temp_board[row][col][1] == king_symbol:
-                    king_pos = (row, col)
-                    break
-            if king_pos:
-                break
-        
-        if not king_pos:
-            return False
-        
-        # Count king's valid moves before our move
-        moves_before = 0
-        row, col = king_pos
-        for dr, dc in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-            new_row, new_col = row + dr, col + dc
-            if self.root._is_valid_move((row, col), (new_row, new_col), check_for_check=False):
-                moves_before += 1
-        
-        # Make our move
-        temp_board[to_pos[0]][to_pos[1]] = piece
-        temp_board[from_pos[0]][from_pos[1]] = None
-        
-        # Count king's valid moves after our move
-        moves_after = 0
-        for dr, dc in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-            new_row, new_col = row + dr, col + dc
-            if self.root._is_valid_move((row, col), (new_row, new_col), check_for_check=False):
-                moves_after += 1
-        
-        return moves_after < moves_before
-
-    def _controls_key_squares(self, move, board):
-        """Helper to check if move controls important squares"""
-        from_pos, to_pos = move
-        temp_board = [row[:] for row in board]
-        piece = temp_board[from_pos[0]][from_pos[1]]
-        opponent = 'red' if piece[0] == 'B' else 'black'
-        
-        # Define key squares based on opponent's color
-        key_squares = []
-        if opponent == 'red':
-            # Key squares around red king's palace
-            key_squares = [(9, 3), (9, 4), (9, 5), (8, 3), (8, 4), (8, 5), (7, 3), (7, 4), (7, 5)]
-        else:
-            # Key squares around black king's palace
-            key_squares = [(0, 3), (0, 4), (0, 5), (1, 3), (1, 4), (1, 5), (2, 3), (2, 4), (2, 5)]
-        
-        # Check if move controls any key squares
-        to_row, to_col = to_pos
-        if (to_row, to_col) in key_squares:
-            return True
-            
-        # Check if piece can attack key squares from new position
-        temp_board[to_pos[0]][to_pos[1]] = piece
-        temp_board[from_pos[0]][from_pos[1]] = None
-        
-        for square in key_squares:
-            if self.root._is_valid_move(to_pos, square, check_for_check=False):
-                return True
-                
-        return False
-
-    def get_promising_moves(self, board):
-        """
-        Identifies promising moves for the current position
-        Args:
-            board: current game board state
-        Returns:
-            list of moves sorted by priority
-        """
-        moves = []
-        
-        # 1. First check for immediate checkmate moves
-        checkmate_moves = self._find_checkmate_moves(board)
-        if checkmate_moves:
-            # Filter out moves that put own king in check
-            valid_checkmate_moves = self._filter_valid_moves(checkmate_moves, board)
-            if valid_checkmate_moves:
-                return valid_checkmate_moves
-        
-        # 2. Check for moves that give check
-        check_moves = self._find_check_moves(board)
-        # Filter out invalid check moves
-        valid_check_moves = self._filter_valid_moves(check_moves, board)
-        moves.extend(valid_check_moves)
-        
-        # 3. Look for moves that restrict king mobility
-        trap_moves = self._find_king_trap_moves(board)
-        valid_trap_moves = self._filter_valid_moves(trap_moves, board)
-        moves.extend(valid_trap_moves)
-        
-        # 4. Add moves that control key squares
-        control_moves = self._find_control_moves(board)
-        valid_control_moves = self._filter_valid_moves(control_moves, board)
-        moves.extend(valid_control_moves)
-        
-        # If no special moves found, get all valid moves
-        if not moves:
-            all_moves = self._get_all_valid_moves(board)
-            moves = self._filter_valid_moves(all_moves, board)
-        
-        return moves
-
-    def _find_checkmate_moves(self, board):
-        """Helper to find moves that lead to immediate checkmate"""
-        checkmate_moves = []
-        player = self.root.current_player
-        
-        # Try each possible move
-        for from_row in range(10):
-            for from_col in range(9):
-                piece = board[from_row][from_col]
-                if piece and piece[0] == player[0].upper():
-                    for to_row in range(10):
-                        for to_col in range(9):
-                            move = ((from_row, from_col), (to_row, to_col))
-                            if self.root._is_valid_move(move[0], move[1]):
-                                # Make temporary move
-                                temp_board = [row[:] for row in board]
-                                temp_board[to_row][to_col] = piece
-                                temp_board[from_row][from_col] = None
-                                
-                                # Check if this creates checkmate
-                                if self._is_checkmate_position(temp_board, player):
-                                    checkmate_moves.append(move)
-                                    
-        return checkmate_moves
-
-    def _find_check_moves(self, board):
-        """Helper to find moves that give check"""
-        check_moves = []
-        for from_row in range(10):
-            for from_col in range(9):
-                piece = board[from_row][from_col]
-                if piece and piece[0] == self.root.current_player[0].upper():
-                    for to_row in range(10):
-                        for to_col in range(9):
-                            move = ((from_row, from_col), (to_row, to_col))
-                            if self.root._is_valid_move(move[0], move[1]):
-                                if self._move_gives_check(move, board):
-                                    check_moves.append(move)
-        return check_moves
-
-    def _find_king_trap_moves(self, board):
-        """Helper to find moves that restrict opponent king's mobility"""
-        trap_moves = []
-        for from_row in range(10):
-            for from_col in range(9):
-                piece = board[from_row][from_col]
-                if piece and piece[0] == self.root.current_player[0].upper():
-                    for to_row in range(10):
-                        for to_col in range(9):
-                            move = ((from_row, from_col), (to_row, to_col))
-                            if self.root._is_valid_move(move[0], move[1]):
-                                if self._reduces_king_mobility(move, board):
-                                    trap_moves.append(move)
-        return trap_moves
-
-    def _find_control_moves(self, board):
-        """Helper to find moves that control key squares"""
-        control_moves = []
-        for from_row in range(10):
-            for from_col in range(9):
-                piece = board[from_row][from_col]
-                if piece and piece[0] == self.root.current_player[0].upper():
-                    for to_row in range(10):
-                        for to_col in range(9):
-                            move = ((from_row, from_col), (to_row, to_col))
-                            if self.root._is_valid_move(move[0], move[1]):
-                                if self._controls_key_squares(move, board):
-                                    control_moves.append(move)
-        return control_moves
-
-    def _get_all_valid_moves(self, board):
-        """Helper to get all valid moves that don't put own king in check"""
-        moves = []
-        for from_row in range(10):
-            for from_col in range(9):
-                piece = board[from_row][from_col]
-                if piece and piece[0] == self.root.current_player[0].upper():
-                    for to_row in range(10):
-                        for to_col in range(9):
-                            move = ((from_row, from_col), (to_row, to_col))
-                            if self.root._is_valid_move(move[0], move[1]):
-                                moves.append(move)
-        
-        # Filter out moves that put own king in check
-        return self._filter_valid_moves(moves, board)
-
-    def _is_checkmate_position(self, board, player):
-        """Helper to check if position is checkmate"""
-        opponent = 'red' if player == 'black' else 'black'
-        
-        # First check if opponent is in check
-        opponent_king_pos = None
-        king_symbol = '帥' if opponent == 'red' else '將'
-        for row in range(10):
-            for col in range(9):
-                if board[row][col] and board[row][col][1] == king_symbol:
-                    opponent_king_pos = (row, col)
-                    break
-            if opponent_king_pos:
-                break
-                
-        if not opponent_king_pos:
-            return False
-            
-        # Check if king is under attack
-        king_in_check = False
-        king_row, king_col = opponent_king_pos
-        for row in range(10):
-            for col in range(9):
-                attacking_piece = board[row][col]
-                if attacking_piece and attacking_piece[0] == player[0].upper():
-                    if self.root._is_valid_move((row, col), opponent_king_pos, check_for_check=False):
-                        king_in_check = True
-                        break
-            if king_in_check:
-                break
-                
-        if not king_in_check:
-            return False
-            
-        # Check if any move can get out of check
-        for row in range(10):
-            for col in range(9):
-                piece = board[row][col]
-                if piece and piece[0] == opponent[0].upper():
-                    for to_row in range(10):
-                        for to_col in range(9):
-                            if self.root._is_valid_move((row, col), (to_row, to_col)):
-                                # Try the move
-                                temp_board = [row[:] for row in board]
-                                temp_board[to_row][to_col] = piece
-                                temp_board[row][col] = None
-                                
-                                # Check if still in check
-                                still_in_check = False
-                                for r in range(10):
-                                    for c in range(9):
-                                        attacking_piece = temp_board[r][c]
-                                        if attacking_piece and attacking_piece[0] == player[0].upper():
-                                            if self.root._is_valid_move((r, c), (to_row, to_col), check_for_check=False):
-                                                still_in_check = True
-                                                break
-                                    if still_in_check:
-                                        break
-                                
-                                if not still_in_check:
-                                    return False
-                                    
-        return True
+    """
+    Piece images rendered once with Pillow, for drawing pieces as canvas
+    image items instead of an oval plus a freshly shaped character.
+    Each piece has a 'normal' variant and a 'highlight' variant with the
+    yellow selection frame drawn in.
+    """
 
-    def make_move(self):
-        # Main MCTS loop
-        for _ in range(self.simulation_limit):
-            node = self.select_node(self.root)
-            
-            if node.untried_moves and node.visits > 0:
-                node = self.expand(node)
-            
-            result = self.simulate(node)
-            self.backpropagate(node, result)
-        
-        # Choose the best move
-        if not self.root.children:
-            return None
-        best_child = max(self.root.children, key=lambda c: c.visits)
-        return best_child.move
-     
-    def select_node(self, node):
-        while node.children and not node.untried_moves:
-            # Modified UCT that considers checkmate potential
-            node = node.get_best_child(c=1.41, checkmate_weight=0.3)
-            if not node:  # Add safety check
-                break
-        return node
-    
-    def expand(self, node):
-        move = random.choice(node.untried_moves)
-        node.untried_moves.remove(move)
-        
-        # Create new board state
-        new_board = [row[:] for row in node.board]
-        from_pos, to_pos = move
-        
-        # Make the move
-        piece = new_board[from_pos[0]][from_pos[1]]
-        new_board[to_pos[0]][to_pos[1]] = piece
-        new_board[from_pos[0]][from_pos[1]] = None
-        new_player = 'red' if node.current_player == 'black' else 'black'
-        
-        # Create new node
-        child = MCTSNode(new_board, new_player, parent=node, move=move)
-        node.children.append(child)
-        return child
-
-    def simulate(self, node):
-        board = [row[:] for row in node.board]
-        current_player = node.current_player
-        moves_count = 0
-        max_moves = 100  # Prevent infinite games
-        
-        while moves_count < max_moves:
-            # Get all valid moves including check validation
-            valid_moves = []
-            for row in range(10):
-                for col in range(9):
-                    piece = board[row][col]
-                    if piece and piece[0] == current_player[0].upper():
-                        for to_row in range(10):
-                            for to_col in range(9):
-                                move = ((row, col), (to_row, to_col))
-                                # Create temporary board to test move
-                                temp_board = [row[:] for row in board]
-                                if self._is_valid_move(move[0], move[1], temp_board):
-                                    # Make move temporarily
-                                    piece = temp_board[row][col]
-                                    temp_board[to_row][to_col] = piece
-                                    temp_board[row][col] = None
-                                    # Check if move puts own king in check
-                                    if not self._is_in_check(current_player, temp_board):
-                                        valid_moves.append(move)
-            
-            if not valid_moves:
-                break
-            
-            # Make random valid move
-            from_pos, to_pos = random.choice(valid_moves)
-            piece = board[from_pos[0]][from_pos[1]]
-            board[to_pos[0]][to_pos[1]] = piece
-            board[from_pos[0]][from_pos[1]] = None
-            current_player = 'red' if current_player == 'black' else 'black'
-            moves_count += 1
-
-        # Improve evaluation to consider king safety
-        black_score = 0
-        red_score = 0
-        for row in board:
-            for piece in row:
-                if piece:
-                    if piece[0] == 'B':
-                        black_score += 1
-                    else:
-                        red_score += 1
-        
-        # Add bonus for king safety
-        if not self._is_in_check('black', board):
-            black_score += 0.5
-        if not self._is_in_check('red', board):
-            red_score += 0.5
-            
-        return 1 if black_score > red_score else 0
+    VARIANTS = ('normal', 'highlight')
+    # KaiTi first, then other CJK fonts commonly found on Windows, macOS and Linux
+    FONT_FILES = ['simkai.ttf', 'KaiTi.ttf', 'STKaiti.ttc', 'Kaiti.ttc', 'simsun.ttc', 'msyh.ttc',
+                  'PingFang.ttc', 'NotoSerifCJK-Regular.ttc', 'NotoSansCJK-Regular.ttc', 'wqy-zenhei.ttc']
+
+    def __init__(self, piece_radius, font_size=25, font_path=None):
+        if Image is None:
+            raise ImportError("Pillow is needed for piece sprites")
+        font = self._load_font(font_size, font_path)
+        size = 2 * (piece_radius + 4)   # Room for the highlight frame around the piece
+        center = size // 2
+        self.images = {}
+        for piece in BoardRules.PIECES:
+            color = 'red' if piece[0] == 'R' else 'black'
+            for variant in self.VARIANTS:
+                image = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+                draw = ImageDraw.Draw(image)
+                if variant == 'highlight':
+                    frame = piece_radius + 2
+                    draw.rectangle([center - frame, center - frame, center + frame, center + frame],
+                                   outline='yellow', width=2)
+                draw.ellipse([center - piece_radius, center - piece_radius,
+                              center + piece_radius, center + piece_radius],
+                             fill='white', outline=color, width=2)
+                # A thin stroke in the text colour stands in for the bold font
+                draw.text((center, center), piece[1], fill=color, font=font, anchor='mm',
+                          stroke_width=1, stroke_fill=color)
+                self.images[(piece, variant)] = ImageTk.PhotoImage(image)
+
+    def _load_font(self, font_size, font_path):
+        """Helper to find a font with the piece characters"""
+        for name in ([font_path] if font_path else self.FONT_FILES):
+            try:
+                return ImageFont.truetype(name, font_size)
+            except OSError:
+                continue
+        raise OSError("No font with Chinese characters found for piece sprites")
+
+    def image(self, piece, variant='normal'):
+        return self.images[(piece, variant)]
 
-    def backpropagate(self, node, result):
-        while node:
-            node.visits += 1
-            if node.current_player == 'black':
-                node.wins += result
-            else:
-                node.wins += (1 - result)
-            node = node.parent
-       
-    def _filter_valid_moves(self, moves, board):
-        """Filter out moves that would put own king in check"""
-        valid_moves = []
-        for move in moves:
-            from_pos, to_pos = move
-            # Make temporary move
-            temp_board = [row[:] for row in board]
-            moving_piece = temp_board[from_pos[0]][from_pos[1]]
-            target_piece = temp_board[to_pos[0]][to_pos[1]]
-            
-            # Try the move
-            temp_board[to_pos[0]][to_pos[1]] = moving_piece
-            temp_board[from_pos[0]][from_pos[1]] = None
-            
-            # Create temporary node to check if move is safe
-            temp_node = MCTSNode(temp_board, self.root.current_player)
-            if not temp_node._is_in_check(self.root.current_player):
-                valid_moves.append(move)
-        
-        return valid_moves       
-       
 class ChineseChess:
 
     """
@@ -879,10 +82,47 @@ class ChineseChess:
         - Identify king safety
     """
     
-    def __init__(self):
+    AI_POLL_MS = 50     # How often the Tk loop checks for the AI's move
+
+    @staticmethod
+    def load_ui_modules():
+        """Import tkinter, pygame.mixer and (optionally) Pillow the first time a game window is made"""
+        global tk, messagebox, pygame, Image, ImageDraw, ImageFont, ImageTk
+        if tk is not None:
+            return
+        import tkinter as tk
+        from tkinter import messagebox
+        import pygame.mixer
+        # Pillow is optional: without it pieces are drawn as canvas ovals and text
+        try:
+            from PIL import Image, ImageDraw, ImageFont, ImageTk
+        except ImportError:
+            Image = None
+
+    def __init__(self, ai_engine='mcts'):
+
+        self.load_ui_modules()
+
+        # Board, side to move, move history and game-over flag (see the properties below)
+        self.state = GameState()
+
+        # Search engine used for the AI side: 'mcts', 'alphabeta' or 'lazysmp'
+        self.ai_engine = ai_engine
+        self.rules = BoardRules()
+        self.legal_move_map = {}    # Side to move's legal moves: from-square -> set of destinations
+        self.transposition_table = TranspositionTable(size_mb=16) if ai_engine == 'alphabeta' else None
+
+        # The AI searches in a worker thread and hands its move back through ai_results,
+        # which the Tk event loop polls; ai_search_id tells stale results from cancelled searches apart
+        self.ai_results = queue.Queue()
+        self.ai_thread = None
+        self.ai_stop_event = None
+        self.ai_search_id = 0
+        self.ai_after_id = None
+        self.ai_thinking = False
 
         # Add these new variables for replay functionality
-        self.move_history = []  # List to store moves for current game
+        self.move_history = None  # MoveHistory for the current game, started with the board
         self.replay_mode = False
         self.current_replay_index = 0
         self.saved_board_states = []  # To store board states for replay
@@ -937,6 +177,16 @@ class ChineseChess:
             bg='#f0d5b0'
         )
         self.canvas.pack()
+
+        # Canvas items kept between redraws (see draw_board)
+        self.board_drawn = False
+        self.piece_items = {}           # (row, col) -> canvas items, see create_piece_items
+        self.spare_piece_items = []     # Hidden items of captured pieces, reused when pieces reappear
+        self.highlight_items = []
+        self.drawn_highlights = []
+        self.destination_items = []
+        self.drawn_destinations = []
+        self.piece_sprites = self.load_piece_sprites()
         
         # Create right frame for the button with padding
         self.button_frame = tk.Frame(self.main_frame)
@@ -989,6 +239,30 @@ class ChineseChess:
         )
         self.next_move_button.pack(pady=5)
 
+        # Toggle for marking the selected piece's legal destinations
+        self.show_destinations = tk.BooleanVar(value=False)
+        self.destinations_button = tk.Checkbutton(
+            self.button_frame,
+            text="显示落点",
+            variable=self.show_destinations,
+            command=self.draw_board,
+            font=('SimSun', 12)
+        )
+        self.destinations_button.pack(pady=5)
+
+        # Slider for jumping straight to any move during replay (initially disabled)
+        self.ply_scale = tk.Scale(
+            self.button_frame,
+            from_=0,
+            to=0,
+            orient=tk.HORIZONTAL,
+            label="跳到第几步",
+            command=self.jump_to_ply,
+            font=('SimSun', 10),
+            state=tk.DISABLED
+        )
+        self.ply_scale.pack(pady=5)
+
         self.set_button_states_for_gameplay()
 
         # Initialize game state
@@ -996,11 +270,48 @@ class ChineseChess:
         self.highlighted_positions = []
         self.current_player = 'red'  # Red moves first
         self.initialize_board()
+        self.move_history = MoveHistory(self.board)
+        self.opening_book = self.load_opening_book()
+        self.tablebases = self.load_tablebases()
         self.draw_board()
                     
         # Bind mouse event
         self.canvas.bind('<Button-1>', self.on_click)
 
+    def load_opening_book(self):
+        """Open the opening book next to this file, (re)writing the default book if it's missing or stale"""
+        current_dir = os.path.dirname(os.path.abspath(__file__))
+        book_path = os.path.join(current_dir, "opening_book.bin")
+        # The default book is built from OpeningBook.DEFAULT_LINES, so it is stale once their source file changes
+        lines_path = inspect.getfile(OpeningBook)
+        try:
+            if not os.path.exists(book_path) or os.path.getmtime(book_path) < os.path.getmtime(lines_path):
+                OpeningBook.build(book_path, self.board)
+            return OpeningBook(book_path)
+        except OSError as e:
+            print(f"Error loading opening book: {str(e)}")
+            return None
+
+    def load_tablebases(self):
+        """Map the endgame tables in the tablebases directory next to this file, if there are any"""
+        current_dir = os.path.dirname(os.path.abspath(__file__))
+        try:
+            tablebases = EndgameTablebases(os.path.join(current_dir, "tablebases"))
+            return tablebases if tablebases.tables else None
+        except Exception as e:
+            print(f"Error loading endgame tables: {str(e)}")
+            return None
+
+    def load_piece_sprites(self):
+        """Pre-render the piece images, or return None to draw pieces as ovals and text"""
+        if Image is None:
+            return None
+        try:
+            return PieceSprites(self.piece_radius)
+        except Exception as e:
+            print(f"Piece sprites unavailable, drawing pieces as shapes: {str(e)}")
+            return None
+
     def show_centered_warning(self, title, message):
         """Shows a warning messagebox centered on the game board"""
         # Wait for any pending events to be processed
@@ -1058,12 +369,41 @@ class ChineseChess:
         warn_window.wait_window()        
 
     def copy_game_state(self):
-        """Create a deep copy of the game state"""
-        new_state = ChineseChess()
-        new_state.board = [row[:] for row in self.board]
-        new_state.current_player = self.current_player
-        new_state.game_over = self.game_over
-        return new_state
+        """Create a deep copy of the game state (headless, no new window)"""
+        return self.state.clone()
+
+    # The UI reads and writes its game state through these, so engines and UI share one GameState
+    @property
+    def board(self):
+        return self.state.board
+
+    @board.setter
+    def board(self, board):
+        self.state.board = board
+
+    @property
+    def current_player(self):
+        return self.state.current_player
+
+    @current_player.setter
+    def current_player(self, color):
+        self.state.current_player = color
+
+    @property
+    def move_history(self):
+        return self.state.history
+
+    @move_history.setter
+    def move_history(self, history):
+        self.state.history = history
+
+    @property
+    def game_over(self):
+        return self.state.game_over
+
+    @game_over.setter
+    def game_over(self, game_over):
+        self.state.game_over = game_over
 
     def handle_game_end(self):
         """Handle end of game tasks"""
@@ -1084,37 +424,31 @@ class ChineseChess:
                     
         self.prev_move_button.config(state=tk.DISABLED)  # Disable previous move button
         self.next_move_button.config(state=tk.DISABLED)  # Disable next move button
+        self.ply_scale.config(state=tk.DISABLED)         # Disable jump-to-ply slider
 
-    def add_move_to_history(self, from_pos, to_pos, piece):
-        """Record a move and board state"""
-        move = {
-            'from_pos': from_pos,
-            'to_pos': to_pos,
-            'piece': piece,
-            'board_state': [row[:] for row in self.board]  # Deep copy of board
-        }
-        self.move_history.append(move)
+    def add_move_to_history(self, from_pos, to_pos, piece, captured=None):
+        """Record a move (the board itself is rebuilt from checkpoints when replaying)"""
+        self.move_history.append(from_pos, to_pos, piece, captured)
 
     def start_replay(self):
 
 
         """Start replay mode"""
+        self.cancel_ai_search()
         if not self.move_history:
             self.show_centered_warning("提示", "没有可以回放的历史记录")
             return
             
         self.replay_mode = True
         self.current_replay_index = 0
-        self.highlighted_positions = []  # Clear all highlights
 
         # Disable normal game buttons during replay
         self.replay_button.config(state=tk.DISABLED)
-        self.next_move_button.config(state=tk.NORMAL)
-        self.prev_move_button.config(state=tk.DISABLED)
+        self.ply_scale.config(state=tk.NORMAL, to=len(self.move_history))
         
         # Reset board to initial state
-        self.initialize_board()
-        self.draw_board()
+        self.board = self.move_history.board_at(0)
+        self.update_replay_view()
 
     def next_replay_move(self):
         """Show next move in replay"""
@@ -1122,23 +456,10 @@ class ChineseChess:
             self.end_replay()
             return
             
-        move = self.move_history[self.current_replay_index]
-        # Restore board state
-        for i in range(len(self.board)):
-            self.board[i] = move['board_state'][i][:]
-        
-        # Highlight the move
-        self.highlighted_positions = [move['from_pos'], move['to_pos']]
+        # Play just this move on the board being shown
+        self.move_history.apply_move(self.board, self.current_replay_index)
         self.current_replay_index += 1
-        
-        # Enable previous button as we're not at the start
-        self.prev_move_button.config(state=tk.NORMAL)
-        
-        # If last move
-        if self.current_replay_index >= len(self.move_history):
-            self.next_move_button.config(state=tk.DISABLED)
-        
-        self.draw_board()
+        self.update_replay_view()
 
     def prev_replay_move(self):
         """Show previous move in replay"""
@@ -1146,31 +467,30 @@ class ChineseChess:
             return
             
         self.current_replay_index -= 1
-        
-        # If at the beginning, disable prev button
-        if self.current_replay_index == 0:
-            self.prev_move_button.config(state=tk.DISABLED)
-        
-        # Always enable next button when we go back
-        self.next_move_button.config(state=tk.NORMAL)
-        
-        # If there are moves to show, display the board state at that index
-        if self.current_replay_index > 0:
-            move = self.move_history[self.current_replay_index - 1]
-            # Restore board state
-            for i in range(len(self.board)):
-                self.board[i] = move['board_state'][i][:]
-        else:
-            # If we're at the beginning, show initial board
-            self.initialize_board()
-        
-        # Update highlights if not at the beginning
-        if self.current_replay_index > 0:
-            move = self.move_history[self.current_replay_index - 1]
-            self.highlighted_positions = [move['from_pos'], move['to_pos']]
+        self.move_history.unapply_move(self.board, self.current_replay_index)
+        self.update_replay_view()
+
+    def jump_to_ply(self, value):
+        """Show the position after the chosen number of moves (replay slider callback)"""
+        ply = int(float(value))
+        if not self.replay_mode or ply == self.current_replay_index:
+            return
+        self.board = self.move_history.board_at(ply)
+        self.current_replay_index = ply
+        self.update_replay_view()
+
+    def update_replay_view(self):
+        """Highlight the last replayed move, update the replay controls and redraw"""
+        index = self.current_replay_index
+        if index > 0:
+            from_pos, to_pos, _, _ = self.move_history[index - 1]
+            self.highlighted_positions = [from_pos, to_pos]
         else:
-            self.highlighted_positions = []
-        
+            self.highlighted_positions = []  # Clear all highlights at the start
+
+        self.prev_move_button.config(state=tk.NORMAL if index > 0 else tk.DISABLED)
+        self.next_move_button.config(state=tk.NORMAL if index < len(self.move_history) else tk.DISABLED)
+        self.ply_scale.set(index)
         self.draw_board()
 
     def end_replay(self):
@@ -1186,8 +506,8 @@ class ChineseChess:
             
     def on_click(self, event):
 
-        if self.replay_mode or self.game_over:  # Add game_over check
-            return  # Ignore clicks when game is over or in replay mode
+        if self.replay_mode or self.game_over or self.ai_thinking:
+            return  # Ignore clicks when game is over, in replay mode or while the AI is moving
 
         # Convert click coordinates to board position (remove the center_offset from here)
         col = round((event.x - self.board_margin) / self.cell_size)
@@ -1207,53 +527,53 @@ class ChineseChess:
                     self.selected_piece = (row, col)
                     self.highlighted_positions = [(row, col)]  # Reset highlights for new selection
                     self.draw_board()
-                # If clicking on a valid move position
-                elif self.is_valid_move(self.selected_piece, (row, col)):
-                    # Store the current state to check for check
-                    original_piece = self.board[row][col]
-                    
-                    # Make the move temporarily
+                # If clicking on a legal destination (looked up in this turn's move map)
+                elif (row, col) in self.legal_move_map.get(self.selected_piece, ()):
+                    # Make the move
+                    captured_piece = self.board[row][col]
                     self.board[row][col] = self.board[start_row][start_col]
                     self.board[start_row][start_col] = None
+
+                    # Keep both the original and new positions highlighted
+                    self.highlighted_positions = [(start_row, start_col), (row, col)]
+                                                                  
+                    # Play move sound
+                    if hasattr(self, 'move_sound') and self.move_sound:
+                        self.move_sound.play()
+                        
+                    # Switch players
+                    self.set_current_player('black' if self.current_player == 'red' else 'red')
                     
-                    # Check if the move puts own king in check
-                    if self.is_in_check(self.current_player):
-                        # Undo the move if it puts own king in check
-                        self.board[start_row][start_col] = self.board[row][col]
-                        self.board[row][col] = original_piece
+                    # Record the move (before the game-end check, so replays include the winning move)
+                    self.add_move_to_history(
+                        (start_row, start_col),
+                        (row, col),
+                        self.board[row][col],
+                        captured_piece
+                    )
+
+                    # A side with no legal moves has lost
+                    if not self.legal_move_map:
+                        self.handle_game_end()
+                        return
 
-                        if self.current_player == 'red':
-                            self.show_centered_warning("Invalid Move", "你正在被将军")
-                        else:
-                            self.show_centered_warning("Invalid Move", "黑方正在被将军")
+                    # Add this code:
+                    if self.current_player == 'black':
+                        # Add a small delay before AI move
+                        self.ai_thinking = True
+                        self.ai_after_id = self.window.after(500, self.make_ai_move)
 
+                    # Reset selected piece
+                    self.selected_piece = None
+                    
+                    # Redraw board
+                    self.draw_board()
+                # The piece could go there, but not without leaving its own king in check
+                elif self.is_valid_move(self.selected_piece, (row, col)):
+                    if self.current_player == 'red':
+                        self.show_centered_warning("Invalid Move", "你正在被将军")
                     else:
-                        # Keep both the original and new positions highlighted
-                        self.highlighted_positions = [(start_row, start_col), (row, col)]
-                                                                      
-                        # Play move sound
-                        if hasattr(self, 'move_sound') and self.move_sound:
-                            self.move_sound.play()
-                            
-                        # Switch players
-                        self.current_player = 'black' if self.current_player == 'red' else 'red'
-                        
-                        # Add this - Check for checkmate after player's move
-                        if self.is_in_check(self.current_player) and self.is_checkmate(self.current_player):
-                            self.handle_game_end()
-                            return
-                        
-                        # Add this line to record the move
-                        self.add_move_to_history(
-                            (start_row, start_col),
-                            (row, col),
-                            self.board[row][col]
-                        )
-
-                        # Add this code:
-                        if self.current_player == 'black':
-                            # Add a small delay before AI move
-                            self.window.after(500, self.make_ai_move)
+                        self.show_centered_warning("Invalid Move", "黑方正在被将军")
 
                     # Reset selected piece
                     self.selected_piece = None
@@ -1281,14 +601,90 @@ class ChineseChess:
         return moves
 
     def make_ai_move(self):
-        """Make an AI move using MCTS algorithm"""
+        """Start the AI search in a worker thread; poll_ai_move applies the result"""
+        self.ai_after_id = None
+        if self.game_over or self.replay_mode or self.current_player != 'black':
+            self.ai_thinking = False
+            return
+
+        # A cancelled search may still be winding down; start once it has finished
+        if self.ai_thread and self.ai_thread.is_alive():
+            self.ai_after_id = self.window.after(self.AI_POLL_MS, self.make_ai_move)
+            return
+
+        self.ai_thinking = True
+        self.ai_search_id += 1
+        self.ai_stop_event = threading.Event()
+        # The worker only sees a snapshot of the position, never the live board
+        state = GameState([row[:] for row in self.board], 'black')
+        self.ai_thread = threading.Thread(
+            target=self.search_ai_move,
+            args=(self.ai_search_id, state, self.ai_stop_event),
+            daemon=True
+        )
+        self.ai_thread.start()
+        self.ai_after_id = self.window.after(self.AI_POLL_MS, self.poll_ai_move)
+
+    def search_ai_move(self, search_id, state, stop_event):
+        """Worker thread body: find the move for a position snapshot and queue it for the Tk loop"""
+        try:
+            # Play from the opening book while the position is in it
+            best_move = None
+            if self.opening_book:
+                best_move = self.opening_book.choose_move(state.board, 'black')
+
+            # Create the engine with only the essential state
+            if not best_move:
+                if self.ai_engine == 'alphabeta':
+                    engine = AlphaBeta(state, transposition_table=self.transposition_table,
+                                       tablebases=self.tablebases, stop_event=stop_event)
+                elif self.ai_engine == 'lazysmp':
+                    engine = LazySMP(state, tablebases=self.tablebases, stop_event=stop_event)
+                else:
+                    engine = MCTS(state, tablebases=self.tablebases, stop_event=stop_event)
+                best_move = engine.make_move()
+            self.ai_results.put((search_id, best_move, None))
+        except Exception as e:
+            self.ai_results.put((search_id, None, e))
+
+    def poll_ai_move(self):
+        """Check for the worker's move from the Tk event loop, dropping results of cancelled searches"""
+        self.ai_after_id = None
+        while True:
+            try:
+                search_id, best_move, error = self.ai_results.get_nowait()
+            except queue.Empty:
+                if self.ai_thinking:
+                    self.ai_after_id = self.window.after(self.AI_POLL_MS, self.poll_ai_move)
+                return
+            if search_id == self.ai_search_id:
+                break
+
+        self.ai_thinking = False
+        if error:
+            print(f"Error in AI move: {str(error)}")
+            self.set_current_player('red')
+            self.draw_board()
+            return
+        self.apply_ai_move(best_move)
+
+    def cancel_ai_search(self):
+        """Stop any pending or running AI search; a result that still arrives is ignored"""
+        if self.ai_after_id is not None:
+            self.window.after_cancel(self.ai_after_id)
+            self.ai_after_id = None
+        if self.ai_stop_event:
+            self.ai_stop_event.set()
+        self.ai_search_id += 1
+        self.ai_thinking = False
+
+    def apply_ai_move(self, best_move):
+        """Play the AI's chosen move on the board"""
         try:
-            # Create MCTS instance with only the essential state
-            mcts = MCTS(self)
-            best_move = mcts.make_move()
-            
             if not best_move:
                 print("No valid moves found")
+                self.set_current_player('red')
+                self.draw_board()
                 return
                 
             from_pos, to_pos = best_move
@@ -1307,6 +703,8 @@ class ChineseChess:
                 self.board[from_pos[0]][from_pos[1]] = moving_piece
                 self.board[to_pos[0]][to_pos[1]] = target_piece
                 print("AI tried to make an invalid move that puts own king in check")
+                self.set_current_player('red')
+                self.draw_board()
                 return
             
             # Play move sound
@@ -1315,16 +713,16 @@ class ChineseChess:
             
             # Update game state
             self.highlighted_positions = [from_pos, to_pos]
-            self.current_player = 'red'
+            self.set_current_player('red')
             
             # Record the move
-            self.add_move_to_history(from_pos, to_pos, moving_piece)
+            self.add_move_to_history(from_pos, to_pos, moving_piece, target_piece)
             
             # Update display
             self.draw_board()
             
             # Check for checkmate immediately after AI's move
-            if self.is_checkmate('red'):  # Check if red (human) is in checkmate
+            if not self.legal_move_map:  # Red (human) has no legal moves left
                 self.game_over = True
                 self.handle_game_end()
                 self.show_centered_warning("游戏结束", "黑方胜利！")  # Black (AI) wins
@@ -1332,7 +730,7 @@ class ChineseChess:
                 
         except Exception as e:
             print(f"Error in AI move: {str(e)}")
-            self.current_player = 'red'
+            self.set_current_player('red')
             self.draw_board()
 
     def is_checkmate(self, color):
@@ -1384,7 +782,7 @@ class ChineseChess:
         y = self.board_margin + row * self.cell_size
         
         # Create a yellow square around the piece
-        self.canvas.create_rectangle(
+        return self.canvas.create_rectangle(
             x - self.piece_radius - 2,
             y - self.piece_radius - 2,
             x + self.piece_radius + 2,
@@ -1400,6 +798,18 @@ class ChineseChess:
         
         # Set up initial piece positions
         self.setup_pieces()
+        self.update_legal_moves()
+
+    def set_current_player(self, color):
+        """Hand the turn to color; every turn change goes through here so the legal-move map stays in step"""
+        self.current_player = color
+        self.update_legal_moves()
+
+    def update_legal_moves(self):
+        """Compute the side to move's legal moves once per turn, as from-square -> set of destinations"""
+        self.legal_move_map = {}
+        for from_pos, to_pos in self.rules.legal_moves(self.board, self.current_player):
+            self.legal_move_map.setdefault(from_pos, set()).add(to_pos)
         
     def setup_pieces(self):
         # Red pieces (bottom)
@@ -1432,9 +842,21 @@ class ChineseChess:
             self.board[row][col] = piece
 
     def draw_board(self):
-        # Clear canvas
-        self.canvas.delete("all")
-        
+        """
+        Bring the canvas in line with self.board.
+        Board lines and labels are drawn once; after that only squares whose
+        piece changed are touched, reusing each piece's canvas items via
+        coords/itemconfig instead of recreating them.
+        """
+        if not self.board_drawn:
+            self.draw_static_board()
+            self.board_drawn = True
+        self.update_piece_items()
+        self.update_highlights()
+        self.update_destination_hints()
+
+    def draw_static_board(self):
+        """Draw the parts of the board that never change"""
         # Draw the outer border
         self.canvas.create_rectangle(
             self.board_margin, self.board_margin,
@@ -1450,14 +872,6 @@ class ChineseChess:
             width=2
         )
 
-        # clear hightlight(3rd modification)
-        self.canvas.delete('highlight')
-
-        # add hightlight(4th modification)
-        if self.selected_piece:
-            row, col = self.selected_piece
-            self.highlight_piece(row, col)
-
         # Draw grid lines
         for i in range(10):  # Horizontal lines
             y = self.board_margin + i * self.cell_size
@@ -1507,40 +921,6 @@ class ChineseChess:
             font=('KaiTi', 20)
         )
         
-        # Draw pieces on intersections
-        for row in range(10):
-            for col in range(9):
-                if self.board[row][col]:
-                    # Calculate position on intersections
-                    x = self.board_margin + col * self.cell_size
-                    y = self.board_margin + row * self.cell_size
-                    
-                    # Draw piece circle
-                    color = 'red' if self.board[row][col][0] == 'R' else 'black'
-                    self.canvas.create_oval(
-                        x - self.piece_radius, y - self.piece_radius,
-                        x + self.piece_radius, y + self.piece_radius,
-                        fill='white',
-                        outline=color,
-                        width=2
-                    )
-                    
-                    # Draw piece text
-                    piece_text = self.board[row][col][1]
-                    text_color = 'red' if self.board[row][col][0] == 'R' else 'black'
-                    self.canvas.create_text(
-                        x, y,
-                        text=piece_text,
-                        fill=text_color,
-                        font=('KaiTi', 25, 'bold')
-                    )
-            
-        # Modify the highlight section to show all highlighted positions
-        self.canvas.delete('highlight')
-        for pos in self.highlighted_positions:
-            row, col = pos
-            self.highlight_piece(row, col)
-
         # Draw column numbers at top and bottom
         # List of Chinese numbers for red side (bottom)
         red_numbers = ['九', '八', '七', '六', '五', '四', '三', '二', '一']
@@ -1569,11 +949,147 @@ class ChineseChess:
                 font=('Arial', 12)
             )
 
+    def update_piece_items(self):
+        """Move, relabel or hide the piece items on squares that changed since the last draw"""
+        changed = []
+        freed = []  # Items of pieces that left their square, still visible
+        for row in range(10):
+            for col in range(9):
+                piece = self.board[row][col]
+                items = self.piece_items.get((row, col))
+                if (items[2] if items else None) != piece:
+                    changed.append((row, col, piece))
+                    if items:
+                        freed.append(self.piece_items.pop((row, col)))
+
+        for row, col, piece in changed:
+            if not piece:
+                continue
+            # Prefer the items of the same piece that just left its square,
+            # so an ordinary move is only a coords update
+            match = next((i for i, items in enumerate(freed) if items[2] == piece), None)
+            if match is not None:
+                items = freed.pop(match)
+            elif freed:
+                items = freed.pop()
+            elif self.spare_piece_items:
+                items = self.spare_piece_items.pop()
+                self.set_piece_items_state(items, tk.NORMAL)
+            else:
+                items = self.create_piece_items(piece)
+            self.place_piece_items(items, row, col, piece)
+            self.piece_items[(row, col)] = items
+
+        # Captured pieces: hide their items and keep them for later
+        for items in freed:
+            self.set_piece_items_state(items, tk.HIDDEN)
+            self.spare_piece_items.append(items)
+
+    def create_piece_items(self, piece):
+        """
+        Create the canvas items for a piece.
+        Returns [image id, None, piece, variant] with sprites, otherwise
+        [oval id, text id, piece, None].
+        """
+        if self.piece_sprites:
+            image = self.canvas.create_image(0, 0, image=self.piece_sprites.image(piece))
+            return [image, None, piece, 'normal']
+        color = 'red' if piece[0] == 'R' else 'black'
+        oval = self.canvas.create_oval(0, 0, 0, 0, fill='white', outline=color, width=2)
+        text = self.canvas.create_text(0, 0, text=piece[1], fill=color, font=('KaiTi', 25, 'bold'))
+        return [oval, text, piece, None]
+
+    def place_piece_items(self, items, row, col, piece):
+        """Move a piece's items onto an intersection, relabelling them if they showed another piece"""
+        x = self.board_margin + col * self.cell_size
+        y = self.board_margin + row * self.cell_size
+        main, text, shown_piece, variant = items
+        if self.piece_sprites:
+            self.canvas.coords(main, x, y)
+            if shown_piece != piece:
+                self.canvas.itemconfig(main, image=self.piece_sprites.image(piece, variant))
+                items[2] = piece
+            return
+
+        self.canvas.coords(main, x - self.piece_radius, y - self.piece_radius,
+                           x + self.piece_radius, y + self.piece_radius)
+        self.canvas.coords(text, x, y)
+        if shown_piece != piece:
+            color = 'red' if piece[0] == 'R' else 'black'
+            self.canvas.itemconfig(main, outline=color)
+            self.canvas.itemconfig(text, text=piece[1], fill=color)
+            items[2] = piece
+
+    def set_piece_items_state(self, items, state):
+        """Show or hide a piece's canvas items"""
+        self.canvas.itemconfig(items[0], state=state)
+        if items[1] is not None:
+            self.canvas.itemconfig(items[1], state=state)
+
+    def set_piece_variant(self, items, variant):
+        """Switch a piece's sprite between 'normal' and 'highlight'"""
+        if items[3] != variant:
+            self.canvas.itemconfig(items[0], image=self.piece_sprites.image(items[2], variant))
+            items[3] = variant
+
+    def update_highlights(self):
+        """
+        Show highlighted_positions. With sprites, occupied squares switch to
+        the highlight sprite; yellow rectangles, created or hidden as needed,
+        mark the remaining squares.
+        """
+        positions = list(self.highlighted_positions)
+        if self.piece_sprites:
+            for square, items in self.piece_items.items():
+                self.set_piece_variant(items, 'highlight' if square in positions else 'normal')
+            positions = [pos for pos in positions if pos not in self.piece_items]
+        if positions == self.drawn_highlights:
+            return
+        for i, (row, col) in enumerate(positions):
+            if i < len(self.highlight_items):
+                x = self.board_margin + col * self.cell_size
+                y = self.board_margin + row * self.cell_size
+                self.canvas.coords(self.highlight_items[i],
+                                   x - self.piece_radius - 2, y - self.piece_radius - 2,
+                                   x + self.piece_radius + 2, y + self.piece_radius + 2)
+                self.canvas.itemconfig(self.highlight_items[i], state=tk.NORMAL)
+            else:
+                self.highlight_items.append(self.highlight_piece(row, col))
+        for item in self.highlight_items[len(positions):]:
+            self.canvas.itemconfig(item, state=tk.HIDDEN)
+        self.drawn_highlights = positions
+
+    def update_destination_hints(self):
+        """Mark the selected piece's legal destinations with dots when the overlay is switched on"""
+        destinations = []
+        if self.selected_piece and self.show_destinations.get() and not self.replay_mode:
+            destinations = sorted(self.legal_move_map.get(self.selected_piece, ()))
+        if destinations == self.drawn_destinations:
+            return
+        radius = self.piece_radius // 4
+        for i, (row, col) in enumerate(destinations):
+            x = self.board_margin + col * self.cell_size
+            y = self.board_margin + row * self.cell_size
+            if i < len(self.destination_items):
+                self.canvas.coords(self.destination_items[i], x - radius, y - radius, x + radius, y + radius)
+                self.canvas.itemconfig(self.destination_items[i], state=tk.NORMAL)
+            else:
+                self.destination_items.append(self.canvas.create_oval(
+                    x - radius, y - radius, x + radius, y + radius,
+                    fill='#2e8b57', outline='', tags='destination'
+                ))
+        for item in self.destination_items[len(destinations):]:
+            self.canvas.itemconfig(item, state=tk.HIDDEN)
+        # Keep the dots above pieces created since they were
+        self.canvas.tag_raise('destination')
+        self.drawn_destinations = destinations
+
     def restart_game(self):
+        self.cancel_ai_search()
+
         # Store the current game's move history if it exists
         if self.move_history:
             self.game_history.append(self.move_history)
-        self.move_history = []
         
         # Reset game state
         self.selected_piece = None
@@ -1588,6 +1104,7 @@ class ChineseChess:
                 
         # Reinitialize the board
         self.initialize_board()
+        self.move_history = MoveHistory(self.board)
         self.draw_board()
 
     # Add piece movement validation(8 functions)
@@ -0,0 +1,3202 @@
+"""
+Headless rules and search engines for Chinese chess (xiangqi).
+
+Everything here runs without tkinter, pygame or a display, so analysis
+servers can import it directly:
+
+    from chess_engine import GameState, MCTS
+
+The Tk game in 2.9.9.py builds its UI on top of these classes.
+"""
+
+import os
+import random
+import math
+import time
+import queue
+import array
+import mmap
+import struct
+import multiprocessing
+from multiprocessing import shared_memory
+from collections import defaultdict, OrderedDict
+
+class LRUCache:
+    """Bounded least-recently-used cache with hit/miss counters"""
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for key, calling compute() and storing the result on a miss"""
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        self.misses += 1
+        value = compute()
+        self.entries[key] = value
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)  # Drop the least recently used entry
+        return value
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+class EvaluationCache:
+    """
+    Direct-mapped cache of static evaluations keyed by Zobrist position key.
+    Each key has exactly one slot (key modulo the entry count) and a new
+    position simply overwrites it, so lookups are O(1) and memory is fixed.
+    """
+
+    EMPTY = -1  # Zobrist keys are non-negative
+
+    def __init__(self, entries=1 << 16):
+        self.entries = entries
+        self.keys = array.array('q', [self.EMPTY]) * entries
+        self.values = array.array('q', [0]) * entries
+        self.hits = 0
+        self.misses = 0
+        self.overwrites = 0
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for key, calling compute() and storing the result on a miss"""
+        slot = key % self.entries
+        if self.keys[slot] == key:
+            self.hits += 1
+            return self.values[slot]
+        self.misses += 1
+        value = compute()
+        if self.keys[slot] != self.EMPTY:
+            self.overwrites += 1
+        self.keys[slot] = key
+        self.values[slot] = value
+        return value
+
+    def clear(self):
+        for slot in range(self.entries):
+            self.keys[slot] = self.EMPTY
+        self.hits = 0
+        self.misses = 0
+        self.overwrites = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': self.entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'overwrites': self.overwrites,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+class BoardRules:
+    """
+    Move rules that work on any board passed in.
+    Unlike the rule methods on MCTSNode and ChineseChess, nothing here reads
+    self.board, so one instance can be shared by every search routine.
+    Pieces are looked up from the target square outwards instead of looping
+    over all 90 squares.
+    """
+
+    ORTHOGONAL = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+    DIAGONAL = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+    # (row step, col step, leg row, leg col) for each horse jump
+    HORSE_JUMPS = [(-2, -1, -1, 0), (-2, 1, -1, 0), (2, -1, 1, 0), (2, 1, 1, 0),
+                   (-1, -2, 0, -1), (1, -2, 0, -1), (-1, 2, 0, 1), (1, 2, 0, 1)]
+
+    # Zobrist keys: one random 63-bit number per (piece, square), plus one for black to move.
+    # A fixed seed keeps keys identical between runs so they can be stored in files.
+    PIECES = ['R帥', 'R仕', 'R相', 'R馬', 'R車', 'R炮', 'R兵',
+              'B將', 'B士', 'B象', 'B馬', 'B車', 'B炮', 'B卒']
+    ZOBRIST = {}
+    _zobrist_rng = random.Random(0x5A0B)
+    for _piece in PIECES:
+        ZOBRIST[_piece] = []
+        for _square in range(90):
+            ZOBRIST[_piece].append(_zobrist_rng.getrandbits(63))
+    ZOBRIST_BLACK_TO_MOVE = _zobrist_rng.getrandbits(63)
+    del _zobrist_rng, _piece, _square
+
+    # Material values, as used by evaluate_piece_safety in 1.0
+    PIECE_VALUES = {
+        '將': 0, '帥': 0,
+        '車': 900,
+        '馬': 450,
+        '炮': 450,
+        '象': 200, '相': 200,
+        '士': 200, '仕': 200,
+        '卒': 100, '兵': 100
+    }
+
+    def position_key(self, board, current_player=None):
+        """
+        Zobrist hash of a board.
+        The side to move is only mixed in when current_player is given.
+        """
+        key = 0
+        zobrist = self.ZOBRIST
+        for row in range(10):
+            board_row = board[row]
+            base = row * 9
+            for col in range(9):
+                piece = board_row[col]
+                if piece:
+                    key ^= zobrist[piece][base + col]
+        if current_player == 'black':
+            key ^= self.ZOBRIST_BLACK_TO_MOVE
+        return key
+
+    def in_palace(self, pos, color_code):
+        """Check if a square is inside the palace of the given side ('R' or 'B')"""
+        row, col = pos
+        if not 3 <= col <= 5:
+            return False
+        return 7 <= row <= 9 if color_code == 'R' else 0 <= row <= 2
+
+    def find_king(self, board, color):
+        """Find the king/general of the given color"""
+        king_symbol = '帥' if color == 'red' else '將'
+        rows = range(7, 10) if color == 'red' else range(0, 3)
+        for row in rows:
+            for col in range(3, 6):
+                if board[row][col] == color[0].upper() + king_symbol:
+                    return (row, col)
+        return None
+
+    def piece_moves(self, board, pos, captures_only=False):
+        """Pseudo-legal destinations of the piece on pos (own king safety not checked)"""
+        row, col = pos
+        piece = board[row][col]
+        side = piece[0]
+        piece_type = piece[1]
+        moves = []
+
+        def add(r, c):
+            if 0 <= r < 10 and 0 <= c < 9:
+                target = board[r][c]
+                if target:
+                    if target[0] != side:
+                        moves.append((r, c))
+                elif not captures_only:
+                    moves.append((r, c))
+
+        if piece_type in ('帥', '將'):
+            for dr, dc in self.ORTHOGONAL:
+                if self.in_palace((row + dr, col + dc), side):
+                    add(row + dr, col + dc)
+
+        elif piece_type in ('仕', '士'):
+            for dr, dc in self.DIAGONAL:
+                if self.in_palace((row + dr, col + dc), side):
+                    add(row + dr, col + dc)
+
+        elif piece_type in ('相', '象'):
+            for dr, dc in self.DIAGONAL:
+                r, c = row + 2 * dr, col + 2 * dc
+                if not (0 <= r < 10 and 0 <= c < 9):
+                    continue
+                # Cannot cross river
+                if (side == 'R' and r < 5) or (side == 'B' and r > 4):
+                    continue
+                # Blocked elephant eye
+                if board[row + dr][col + dc]:
+                    continue
+                add(r, c)
+
+        elif piece_type == '馬':
+            for dr, dc, leg_r, leg_c in self.HORSE_JUMPS:
+                r, c = row + dr, col + dc
+                if not (0 <= r < 10 and 0 <= c < 9):
+                    continue
+                # Blocked horse leg
+                if board[row + leg_r][col + leg_c]:
+                    continue
+                add(r, c)
+
+        elif piece_type == '車':
+            for dr, dc in self.ORTHOGONAL:
+                r, c = row + dr, col + dc
+                while 0 <= r < 10 and 0 <= c < 9:
+                    add(r, c)
+                    if board[r][c]:
+                        break
+                    r, c = r + dr, c + dc
+
+        elif piece_type == '炮':
+            for dr, dc in self.ORTHOGONAL:
+                r, c = row + dr, col + dc
+                # Slide to empty squares until the screen
+                while 0 <= r < 10 and 0 <= c < 9 and not board[r][c]:
+                    if not captures_only:
+                        moves.append((r, c))
+                    r, c = r + dr, c + dc
+                # Jump over the screen to the first piece behind it
+                r, c = r + dr, c + dc
+                while 0 <= r < 10 and 0 <= c < 9:
+                    if board[r][c]:
+                        if board[r][c][0] != side:
+                            moves.append((r, c))
+                        break
+                    r, c = r + dr, c + dc
+
+        elif piece_type in ('兵', '卒'):
+            forward = -1 if side == 'R' else 1
+            add(row + forward, col)
+            # Sideways moves after crossing the river
+            if (side == 'R' and row <= 4) or (side == 'B' and row >= 5):
+                add(row, col - 1)
+                add(row, col + 1)
+
+        return moves
+
+    def attackers(self, board, pos, attacking_color):
+        """
+        Find pieces of attacking_color that can move to pos on this board.
+        Cannons need a screen only if pos is occupied, matching is_valid_move.
+        Kings facing each other are not included; see generals_facing.
+        """
+        row, col = pos
+        side = attacking_color[0].upper()
+        occupied = board[row][col] is not None
+        found = []
+
+        # Chariots and cannons along the four lines
+        for dr, dc in self.ORTHOGONAL:
+            r, c = row + dr, col + dc
+            screens = 0
+            while 0 <= r < 10 and 0 <= c < 9:
+                piece = board[r][c]
+                if piece:
+                    if piece[0] == side:
+                        if screens == 0 and piece[1] == '車':
+                            found.append((r, c))
+                        elif piece[1] == '炮' and screens == (1 if occupied else 0):
+                            found.append((r, c))
+                    screens += 1
+                    if screens > 1:
+                        break
+                r, c = r + dr, c + dc
+
+        # Horses, with the leg measured from the horse's side
+        for dr, dc, leg_r, leg_c in self.HORSE_JUMPS:
+            r, c = row - dr, col - dc
+            if 0 <= r < 10 and 0 <= c < 9:
+                piece = board[r][c]
+                if piece and piece[0] == side and piece[1] == '馬' and not board[r + leg_r][c + leg_c]:
+                    found.append((r, c))
+
+        # Pawns: from behind, or from the side once across the river
+        back = 1 if side == 'R' else -1
+        r = row + back
+        if 0 <= r < 10:
+            piece = board[r][col]
+            if piece and piece[0] == side and piece[1] in ('兵', '卒'):
+                found.append((r, col))
+        crossed = row <= 4 if side == 'R' else row >= 5
+        if crossed:
+            for c in (col - 1, col + 1):
+                if 0 <= c < 9:
+                    piece = board[row][c]
+                    if piece and piece[0] == side and piece[1] in ('兵', '卒'):
+                        found.append((row, c))
+
+        # Palace pieces
+        if self.in_palace(pos, side):
+            for dr, dc in self.ORTHOGONAL:
+                r, c = row + dr, col + dc
+                if self.in_palace((r, c), side):
+                    piece = board[r][c]
+                    if piece and piece[0] == side and piece[1] in ('帥', '將'):
+                        found.append((r, c))
+            for dr, dc in self.DIAGONAL:
+                r, c = row + dr, col + dc
+                if self.in_palace((r, c), side):
+                    piece = board[r][c]
+                    if piece and piece[0] == side and piece[1] in ('仕', '士'):
+                        found.append((r, c))
+
+        # Elephants on their own side of the river
+        if (side == 'R' and row >= 5) or (side == 'B' and row <= 4):
+            for dr, dc in self.DIAGONAL:
+                r, c = row + 2 * dr, col + 2 * dc
+                if 0 <= r < 10 and 0 <= c < 9:
+                    piece = board[r][c]
+                    if piece and piece[0] == side and piece[1] in ('相', '象') and not board[row + dr][col + dc]:
+                        found.append((r, c))
+
+        return found
+
+    def generals_facing(self, board, red_king_pos=None, black_king_pos=None):
+        """Check if the two generals face each other on an open file"""
+        red_king_pos = red_king_pos or self.find_king(board, 'red')
+        black_king_pos = black_king_pos or self.find_king(board, 'black')
+        if not red_king_pos or not black_king_pos:
+            return False
+        if red_king_pos[1] != black_king_pos[1]:
+            return False
+        col = red_king_pos[1]
+        for row in range(black_king_pos[0] + 1, red_king_pos[0]):
+            if board[row][col]:
+                return False
+        return True
+
+    def get_checkers(self, board, color):
+        """List the enemy pieces giving check to color's king (the enemy king if generals face)"""
+        king_pos = self.find_king(board, color)
+        if not king_pos:
+            return []
+        opponent = 'black' if color == 'red' else 'red'
+        checkers = self.attackers(board, king_pos, opponent)
+        if self.generals_facing(board):
+            checkers.append(self.find_king(board, opponent))
+        return checkers
+
+    def is_in_check(self, board, color):
+        """Check if the king of the given color is in check"""
+        king_pos = self.find_king(board, color)
+        if not king_pos:
+            return False
+        opponent = 'black' if color == 'red' else 'red'
+        if self.generals_facing(board):
+            return True
+        return bool(self.attackers(board, king_pos, opponent))
+
+    def _line_between(self, from_pos, to_pos):
+        """Squares strictly between two squares on the same row or column"""
+        (from_row, from_col), (to_row, to_col) = from_pos, to_pos
+        if from_row == to_row:
+            step = 1 if to_col > from_col else -1
+            return [(from_row, c) for c in range(from_col + step, to_col, step)]
+        if from_col == to_col:
+            step = 1 if to_row > from_row else -1
+            return [(r, from_col) for r in range(from_row + step, to_row, step)]
+        return []
+
+    def _leaves_king_safe(self, board, move, color):
+        """Make a move in place, test own king safety, and undo it"""
+        (from_row, from_col), (to_row, to_col) = move
+        moving_piece = board[from_row][from_col]
+        captured_piece = board[to_row][to_col]
+        board[to_row][to_col] = moving_piece
+        board[from_row][from_col] = None
+        safe = not self.is_in_check(board, color)
+        board[from_row][from_col] = moving_piece
+        board[to_row][to_col] = captured_piece
+        return safe
+
+    def static_exchange(self, board, move):
+        """
+        Static exchange evaluation (SEE) of a capture: the material the mover
+        expects to win if both sides keep recapturing on the target square
+        with their cheapest piece, either side free to stop. Attackers are
+        looked up again after every capture, so pieces lined up behind, and
+        cannon screens that appear or vanish, are accounted for. The board is
+        restored before returning.
+        """
+        from_pos, to_pos = move
+        to_row, to_col = to_pos
+        target = board[to_row][to_col]
+        if not target:
+            return 0
+        values = self.PIECE_VALUES
+        piece = board[from_pos[0]][from_pos[1]]
+        changes = [(from_pos, piece), (to_pos, target)]
+        gains = [values[target[1]]]
+
+        board[from_pos[0]][from_pos[1]] = None
+        board[to_row][to_col] = piece
+        on_square = piece
+        side = 'red' if piece[0] == 'B' else 'black'
+
+        while True:
+            attackers = self.attackers(board, to_pos, side)
+            if not attackers:
+                break
+            # Recapture with the cheapest piece; the king only goes last
+            from_square = min(attackers, key=lambda pos: self._exchange_order(board[pos[0]][pos[1]]))
+            attacker = board[from_square[0]][from_square[1]]
+            opponent = 'red' if side == 'black' else 'black'
+
+            changes.append((from_square, attacker))
+            board[from_square[0]][from_square[1]] = None
+            board[to_row][to_col] = attacker
+            if attacker[1] in ('帥', '將') and self.attackers(board, to_pos, opponent):
+                # The king can't capture onto a defended square
+                board[from_square[0]][from_square[1]] = attacker
+                board[to_row][to_col] = on_square
+                changes.pop()
+                break
+
+            gains.append(values[on_square[1]] - gains[-1])
+            on_square = attacker
+            side = opponent
+
+        for pos, original in reversed(changes):
+            board[pos[0]][pos[1]] = original
+
+        # Either side may stop capturing when continuing would lose material
+        for depth in range(len(gains) - 1, 0, -1):
+            gains[depth - 1] = -max(-gains[depth - 1], gains[depth])
+        return gains[0]
+
+    def _exchange_order(self, piece):
+        """Sort key for recaptures: cheapest piece first, king last"""
+        if piece[1] in ('帥', '將'):
+            return 1000000
+        return self.PIECE_VALUES[piece[1]]
+
+    def legal_moves(self, board, color):
+        """All moves for color that don't leave its own king in check"""
+        side = color[0].upper()
+        moves = []
+        for row in range(10):
+            for col in range(9):
+                piece = board[row][col]
+                if piece and piece[0] == side:
+                    for to_pos in self.piece_moves(board, (row, col)):
+                        move = ((row, col), to_pos)
+                        if self._leaves_king_safe(board, move, color):
+                            moves.append(move)
+        return moves
+
+    def has_legal_evasion(self, board, color, checkers):
+        """
+        Check if color can get out of check.
+        Only moves that could answer the first checker are tried: king steps,
+        capturing the checker, blocking the line or horse leg, and moving a
+        cannon's screen away. Returns at the first legal one.
+        """
+        king_pos = self.find_king(board, color)
+        if not king_pos:
+            return False
+        side = color[0].upper()
+
+        # 1. King moves
+        for to_pos in self.piece_moves(board, king_pos):
+            if self._leaves_king_safe(board, (king_pos, to_pos), color):
+                return True
+
+        checker = checkers[0]
+        checker_type = board[checker[0]][checker[1]][1]
+
+        # 2. Capture the checker, or 3. put a piece on a square that breaks the attack
+        target_squares = [checker]
+        if checker_type in ('車', '炮', '帥', '將'):
+            target_squares += self._line_between(checker, king_pos)
+        elif checker_type == '馬':
+            row_diff = king_pos[0] - checker[0]
+            col_diff = king_pos[1] - checker[1]
+            if abs(row_diff) == 2:
+                target_squares.append((checker[0] + row_diff // 2, checker[1]))
+            else:
+                target_squares.append((checker[0], checker[1] + col_diff // 2))
+
+        for square in target_squares:
+            for from_pos in self.attackers(board, square, color):
+                if from_pos == king_pos:
+                    continue
+                if self._leaves_king_safe(board, (from_pos, square), color):
+                    return True
+
+        # 4. Move our own cannon screen off the line
+        if checker_type == '炮':
+            for screen in self._line_between(checker, king_pos):
+                piece = board[screen[0]][screen[1]]
+                if piece and piece[0] == side:
+                    for to_pos in self.piece_moves(board, screen):
+                        if self._leaves_king_safe(board, (screen, to_pos), color):
+                            return True
+
+        return False
+
+    def is_checkmate(self, board, color):
+        """Check if color is in check with no legal evasion"""
+        checkers = self.get_checkers(board, color)
+        if not checkers:
+            return False
+        return not self.has_legal_evasion(board, color, checkers)
+
+class Evaluator:
+    """
+    Static evaluation: material plus a piece-square table per piece type.
+    Every (piece, square) pair has one precomputed value, so a position
+    is a sum of table lookups and a move changes the score by a few
+    additions (see move_delta). No move rules are consulted.
+    Scores are in the same units as BoardRules.PIECE_VALUES.
+    """
+
+    # Piece-square bonuses from red's side of the board (row 9 is red's back rank);
+    # black uses the same tables flipped top to bottom
+    PIECE_SQUARE_TABLES = {
+        '兵': [
+            [0, 3, 6, 9, 12, 9, 6, 3, 0],
+            [20, 30, 45, 55, 60, 55, 45, 30, 20],
+            [20, 30, 45, 50, 55, 50, 45, 30, 20],
+            [20, 27, 30, 40, 42, 40, 30, 27, 20],
+            [10, 18, 22, 35, 40, 35, 22, 18, 10],
+            [3, 0, 4, 0, 7, 0, 4, 0, 3],
+            [-2, 0, -2, 0, 6, 0, -2, 0, -2],
+            [0, 0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0, 0],
+        ],
+        '馬': [
+            [4, 8, 16, 12, 4, 12, 16, 8, 4],
+            [4, 10, 28, 16, 8, 16, 28, 10, 4],
+            [12, 14, 16, 20, 18, 20, 16, 14, 12],
+            [8, 24, 18, 24, 20, 24, 18, 24, 8],
+            [6, 16, 14, 18, 16, 18, 14, 16, 6],
+            [4, 12, 16, 14, 12, 14, 16, 12, 4],
+            [2, 6, 8, 6, 10, 6, 8, 6, 2],
+            [4, 2, 8, 8, 4, 8, 8, 2, 4],
+            [0, 2, 4, 4, -2, 4, 4, 2, 0],
+            [0, -4, 0, 0, 0, 0, 0, -4, 0],
+        ],
+        '車': [
+            [14, 14, 12, 18, 16, 18, 12, 14, 14],
+            [16, 20, 18, 24, 26, 24, 18, 20, 16],
+            [12, 12, 12, 18, 18, 18, 12, 12, 12],
+            [12, 18, 16, 22, 22, 22, 16, 18, 12],
+            [12, 14, 12, 18, 18, 18, 12, 14, 12],
+            [12, 16, 14, 20, 20, 20, 14, 16, 12],
+            [6, 10, 8, 14, 14, 14, 8, 10, 6],
+            [4, 8, 6, 14, 12, 14, 6, 8, 4],
+            [8, 4, 8, 16, 8, 16, 8, 4, 8],
+            [-2, 10, 6, 14, 12, 14, 6, 10, -2],
+        ],
+        '炮': [
+            [6, 4, 0, -10, -12, -10, 0, 4, 6],
+            [2, 2, 0, -4, -14, -4, 0, 2, 2],
+            [2, 2, 0, -10, -8, -10, 0, 2, 2],
+            [0, 0, -2, 4, 10, 4, -2, 0, 0],
+            [0, 0, 0, 2, 8, 2, 0, 0, 0],
+            [-2, 0, 4, 2, 6, 2, 4, 0, -2],
+            [0, 0, 0, 2, 4, 2, 0, 0, 0],
+            [4, 0, 8, 6, 10, 6, 8, 0, 4],
+            [0, 2, 4, 6, 6, 6, 4, 2, 0],
+            [0, 0, 2, 6, 6, 6, 2, 0, 0],
+        ],
+        # Palace and home-side pieces only use the rows they can reach
+        '仕': [[0] * 9 for _ in range(7)] + [
+            [0, 0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 3, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0, 0],
+        ],
+        '相': [[0] * 9 for _ in range(5)] + [
+            [0, 0, -2, 0, 0, 0, -2, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0, 0],
+            [-2, 0, 0, 0, 3, 0, 0, 0, -2],
+            [0, 0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0, 0],
+        ],
+        '帥': [[0] * 9 for _ in range(7)] + [
+            [0, 0, 0, -12, -16, -12, 0, 0, 0],
+            [0, 0, 0, -6, -8, -6, 0, 0, 0],
+            [0, 0, 0, 2, 4, 2, 0, 0, 0],
+        ],
+    }
+    # Black piece names that share a table with the red piece
+    BLACK_EQUIVALENTS = {'卒': '兵', '士': '仕', '象': '相', '將': '帥', '馬': '馬', '車': '車', '炮': '炮'}
+
+    def __init__(self, cache=None):
+        self.cache = cache  # Optional EvaluationCache for evaluate() calls that pass a key
+        # SQUARE_VALUES[piece][row * 9 + col] = material + positional value for that piece's side
+        self.square_values = {}
+        for piece in BoardRules.PIECES:
+            piece_type = piece[1]
+            table = self.PIECE_SQUARE_TABLES[self.BLACK_EQUIVALENTS.get(piece_type, piece_type)]
+            values = []
+            for row in range(10):
+                table_row = table[row] if piece[0] == 'R' else table[9 - row]
+                for col in range(9):
+                    values.append(BoardRules.PIECE_VALUES[piece_type] + table_row[col])
+            self.square_values[piece] = values
+
+    def evaluate(self, board, color='red', key=None):
+        """
+        Full evaluation of a board from color's point of view.
+        Pass the board's position key (BoardRules.position_key without the
+        side to move) to go through the evaluation cache.
+        """
+        if self.cache is not None and key is not None:
+            score = self.cache.get_or_compute(key, lambda: self._material_and_position(board))
+        else:
+            score = self._material_and_position(board)
+        return score if color == 'red' else -score
+
+    def _material_and_position(self, board):
+        """Red-minus-black sum of the square values of every piece"""
+        square_values = self.square_values
+        score = 0
+        for row in range(10):
+            board_row = board[row]
+            base = row * 9
+            for col in range(9):
+                piece = board_row[col]
+                if piece:
+                    if piece[0] == 'R':
+                        score += square_values[piece][base + col]
+                    else:
+                        score -= square_values[piece][base + col]
+        return score
+
+    def move_delta(self, move, piece, captured):
+        """Change in the red-minus-black score when piece makes move (capturing captured, if any)"""
+        (from_row, from_col), (to_row, to_col) = move
+        values = self.square_values[piece]
+        delta = values[to_row * 9 + to_col] - values[from_row * 9 + from_col]
+        if captured:
+            delta += self.square_values[captured][to_row * 9 + to_col]
+        return delta if piece[0] == 'R' else -delta
+
+class MCTSNode:
+        
+    def __init__(self, board, current_player, parent=None, move=None):
+        self.board = [row[:] for row in board]  # Only store the board
+        self.current_player = current_player    # Only store the current player
+        self.parent = parent
+        self.move = move
+        self.children = []
+        self.wins = 0       # Wins for the player who made self.move
+        self.visits = 0
+        # All-moves-as-first (RAVE) statistics for moves played by current_player
+        # anywhere after this node in a simulation, keyed by move
+        self.amaf_wins = defaultdict(float)
+        self.amaf_visits = defaultdict(int)
+        # Implicit minimax: static evaluation of this node and its minimax backup,
+        # both as a win probability for the player who made self.move
+        self.eval_value = None
+        self.minimax_value = None
+        self.key = None     # Position key without the side to move, for the evaluation cache
+        self.untried_moves = self.get_valid_moves()
+
+    def get_best_child(self, c=1.41, checkmate_weight=0.3, rave_k=0, minimax_weight=0):
+        best_score = float('-inf')
+        best_child = None
+        
+        for child in self.children:
+            # Standard UCT score
+            if child.visits == 0:
+                uct_score = float('inf')
+            else:
+                win_rate = child.wins / child.visits
+                amaf_visits = self.amaf_visits[child.move] if rave_k else 0
+                if amaf_visits:
+                    # Lean on RAVE while the child has few visits of its own, fading it out as they grow
+                    beta = math.sqrt(rave_k / (3 * child.visits + rave_k))
+                    amaf_rate = self.amaf_wins[child.move] / amaf_visits
+                    win_rate = (1 - beta) * win_rate + beta * amaf_rate
+                if minimax_weight and child.minimax_value is not None:
+                    win_rate = (1 - minimax_weight) * win_rate + minimax_weight * child.minimax_value
+                uct_score = win_rate + \
+                           c * math.sqrt(math.log(self.visits) / child.visits)
+            
+            # Add checkmate potential score
+            checkmate_score = 0
+            if hasattr(child, 'board'):
+                # Check if move puts opponent in check
+                if child._is_in_check(child.current_player):
+                    checkmate_score += 0.5
+                    
+                # Check if move restricts opponent king's mobility
+                opponent_king_moves = self._count_king_moves(child.board, child.current_player)
+                checkmate_score += (8 - opponent_king_moves) * 0.1
+            
+            # Combine scores
+            total_score = uct_score + checkmate_weight * checkmate_score
+            
+            if total_score > best_score:
+                best_score = total_score
+                best_child = child
+                
+        return best_child
+
+    def _count_king_moves(self, board, player):
+        """Helper method to count available king moves"""
+        king_pos = None
+        # Find king position
+        for row in range(10):
+            for col in range(9):
+                piece = board[row][col]
+                if piece and piece[0] == player[0].upper() and piece[1] in ['帥', '將']:
+                    king_pos = (row, col)
+                    break
+            if king_pos:
+                break
+        
+        if not king_pos:
+            return 0
+            
+        # Count valid moves for king
+        valid_moves = 0
+        row, col = king_pos
+        for dr, dc in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
+            new_row, new_col = row + dr, col + dc
+            # Check if move is valid (within palace and not blocked)
+            if self._is_valid_move((row, col), (new_row, new_col), check_for_check=False):
+                valid_moves += 1
+                
+        return valid_moves
+
+    def get_valid_moves(self):
+        moves = []
+        for row in range(10):
+            for col in range(9):
+                piece = self.board[row][col]
+                if piece and piece[0] == self.current_player[0].upper():
+                    for to_row in range(10):
+                        for to_col in range(9):
+                            if self._is_valid_move((row, col), (to_row, to_col)):
+                                moves.append(((row, col), (to_row, to_col)))
+        return moves
+
+    def _is_valid_move(self, from_pos, to_pos, check_for_check=True):
+        from_row, from_col = from_pos
+        to_row, to_col = to_pos
+        piece = self.board[from_row][from_col]
+        
+        # Basic validation
+        if not (0 <= to_row < 10 and 0 <= to_col < 9):
+            return False
+            
+        # Can't capture own pieces
+        if self.board[to_row][to_col] and self.board[to_row][to_col][0] == piece[0]:
+            return False
+        
+        # Get piece type
+        piece_type = piece[1]
+        
+        # Check specific piece movement rules
+        if piece_type == '帥' or piece_type == '將':  # General/King
+            # Check if move is within palace (3x3 grid)
+            if piece[0] == 'R':  # Red general
+                if not (7 <= to_row <= 9 and 3 <= to_col <= 5):
+                    return False
+            else:  # Black general
+                if not (0 <= to_row <= 2 and 3 <= to_col <= 5):
+                    return False
+            # Can only move one step horizontally or vertically
+            if abs(to_row - from_row) + abs(to_col - from_col) != 1:
+                return False
+                
+        elif piece_type == '仕' or piece_type == '士':  # Advisor
+            # Check if move is within palace
+            if piece[0] == 'R':  # Red advisor
+                if not (7 <= to_row <= 9 and 3 <= to_col <= 5):
+                    return False
+            else:  # Black advisor
+                if not (0 <= to_row <= 2 and 3 <= to_col <= 5):
+                    return False
+            # Must move exactly one step diagonally
+            if abs(to_row - from_row) != 1 or abs(to_col - from_col) != 1:
+                return False
+                
+        elif piece_type == '相' or piece_type == '象':  # Elephant
+            # Cannot cross river
+            if piece[0] == 'R':  # Red elephant
+                if to_row < 5:  # Cannot cross river
+                    return False
+            else:  # Black elephant
+                if to_row > 4:  # Cannot cross river
+                    return False
+            # Must move exactly two steps diagonally
+            if abs(to_row - from_row) != 2 or abs(to_col - from_col) != 2:
+                return False
+            # Check if there's a piece blocking the elephant's path
+            blocking_row = (from_row + to_row) // 2
+            blocking_col = (from_col + to_col) // 2
+            if self.board[blocking_row][blocking_col]:
+                return False
+                
+        elif piece_type == '馬':  # Horse
+            row_diff = abs(to_row - from_row)
+            col_diff = abs(to_col - from_col)
+            if not ((row_diff == 2 and col_diff == 1) or (row_diff == 1 and col_diff == 2)):
+                return False
+            # Check for blocking piece
+            if row_diff == 2:
+                blocking_row = from_row + (1 if to_row > from_row else -1)
+                if self.board[blocking_row][from_col]:
+                    return False
+            else:
+                blocking_col = from_col + (1 if to_col > from_col else -1)
+                if self.board[from_row][blocking_col]:
+                    return False
+                    
+        elif piece_type == '車':  # Chariot
+            if from_row != to_row and from_col != to_col:
+                return False
+            # Check if path is clear
+            if from_row == to_row:  # Horizontal move
+                start_col = min(from_col, to_col) + 1
+                end_col = max(from_col, to_col)
+                for col in range(start_col, end_col):
+                    if self.board[from_row][col]:
+                        return False
+            else:  # Vertical move
+                start_row = min(from_row, to_row) + 1
+                end_row = max(from_row, to_row)
+                for row in range(start_row, end_row):
+                    if self.board[row][from_col]:
+                        return False
+                        
+        elif piece_type == '炮':  # Cannon
+            if from_row != to_row and from_col != to_col:
+                return False
+            # Count pieces between from and to positions
+            pieces_between = 0
+            if from_row == to_row:  # Horizontal move
+                start_col = min(from_col, to_col) + 1
+                end_col = max(from_col, to_col)
+                for col in range(start_col, end_col):
+                    if self.board[from_row][col]:
+                        pieces_between += 1
+            else:  # Vertical move
+                start_row = min(from_row, to_row) + 1
+                end_row = max(from_row, to_row)
+                for row in range(start_row, end_row):
+                    if self.board[row][from_col]:
+                        pieces_between += 1
+            # If capturing, need exactly one piece between
+            if self.board[to_row][to_col]:
+                return pieces_between == 1
+            # If not capturing, path must be clear
+            return pieces_between == 0
+            
+        elif piece_type == '兵' or piece_type == '卒':  # Pawn
+            if piece[0] == 'R':  # Red pawn
+                # Before crossing river
+                if from_row > 4:
+                    # Can only move forward (up)
+                    return to_col == from_col and to_row == from_row - 1
+                # After crossing river
+                else:
+                    # Can move forward or sideways
+                    return (to_col == from_col and to_row == from_row - 1) or \
+                           (to_row == from_row and abs(to_col - from_col) == 1)
+            else:  # Black pawn
+                # Before crossing river
+                if from_row < 5:
+                    # Can only move forward (down)
+                    return to_col == from_col and to_row == from_row + 1
+                # After crossing river
+                else:
+                    # Can move forward or sideways
+                    return (to_col == from_col and to_row == from_row + 1) or \
+                           (to_row == from_row and abs(to_col - from_col) == 1)
+        
+        return True
+
+    def UCT_select_child(self):
+        # UCT formula for node selection
+        exploration_constant = 1.41  # Typical value for UCT
+        
+        best_score = float('-inf')
+        best_child = None
+        
+        for child in self.children:
+            if child.visits == 0:
+                score = float('inf')
+            else:
+                score = (child.wins / child.visits) + \
+                        exploration_constant * math.sqrt(math.log(self.visits) / child.visits)
+            
+            if score > best_score:
+                best_score = score
+                best_child = child
+                
+        return best_child
+
+    def _is_in_check(self, color):
+        """Check if the king of the given color is in check"""
+        red_king_pos, black_king_pos = self._find_kings()
+        
+        if not red_king_pos or not black_king_pos:
+            return False
+        
+        # First check the special case of facing generals
+        if self._is_generals_facing():
+            return True  # Both kings are in check in this case
+        
+        # Then check the normal cases of being under attack
+        if color == 'red':
+            return self._is_position_under_attack(red_king_pos, 'black')
+        else:
+            return self._is_position_under_attack(black_king_pos, 'red')
+
+    def _find_kings(self):
+        """Find positions of both kings/generals"""
+        red_king_pos = black_king_pos = None
+        for row in range(10):
+            for col in range(9):
+                piece = self.board[row][col]
+                if piece:
+                    if piece[1] == '帥':
+                        red_king_pos = (row, col)
+                    elif piece[1] == '將':
+                        black_king_pos = (row, col)
+        return red_king_pos, black_king_pos
+
+    def _is_position_under_attack(self, pos, attacking_color):
+        """Check if a position is under attack by pieces of the given color"""
+        target_row, target_col = pos
+        
+        # Check from all positions on the board
+        for row in range(10):
+            for col in range(9):
+                piece = self.board[row][col]
+                if piece and piece[0] == attacking_color[0].upper():
+                    # Check if this piece can move to the target position
+                    if self._is_valid_move((row, col), pos):
+                        return True
+        return False
+
+    def _is_generals_facing(self):
+        """Check if the two generals are facing each other directly"""
+        red_king_pos, black_king_pos = self._find_kings()
+        
+        # If either king is missing, return False
+        if not red_king_pos or not black_king_pos:
+            return False
+            
+        red_row, red_col = red_king_pos
+        black_row, black_col = black_king_pos
+        
+        # Check if generals are in the same column
+        if red_col != black_col:
+            return False
+            
+        # Check if there are any pieces between the generals
+        start_row = min(red_row, black_row) + 1
+        end_row = max(red_row, black_row)
+        
+        for row in range(start_row, end_row):
+            if self.board[row][red_col]:  # If there's any piece between
+                return False
+        
+        # If we get here, the generals are facing each other
+        return True
+
+
+class MCTS:
+
+    # Score penalty at the end of a rollout for the side left in check
+    ROLLOUT_CHECK_PENALTY = 100
+
+    # Running totals of how often each stop rule ended a search early
+    stop_rule_counts = defaultdict(int)
+
+    # Move features and mate tests, shared across searches so later turns reuse them
+    feature_cache = LRUCache(max_entries=200000)
+    # Static evaluations by position key, shared the same way (pass eval_cache to use another size)
+    eval_cache = EvaluationCache(entries=1 << 18)
+
+    def __init__(self, game_state, simulation_limit=1000, early_stop=True,
+                 confidence_stop=False, confidence_z=2.58, confidence_min_visits=30,
+                 use_rave=True, rave_k=300, implicit_minimax=False, minimax_weight=0.3,
+                 rollout_depth=100, eval_scale=400, rollout_capture_bias=0.5, tablebases=None,
+                 eval_cache=None, stop_event=None):
+        self.root = MCTSNode(
+            board=[row[:] for row in game_state.board],
+            current_player=game_state.current_player
+        )
+        self.simulation_limit = simulation_limit
+        self.rules = BoardRules()
+        self.evaluator = Evaluator(cache=eval_cache or MCTS.eval_cache)
+        self.root.key = self.rules.position_key(self.root.board)
+        self.early_stop = early_stop                    # Stop once the best move can't be overtaken
+        self.confidence_stop = confidence_stop          # Stop once the best move is clearly separated
+        self.confidence_z = confidence_z                # Width of the confidence bound (2.58 ~ 99%)
+        self.confidence_min_visits = confidence_min_visits
+        # RAVE weight equals the node's own stats at about rave_k / 3 visits
+        self.rave_k = rave_k if use_rave else 0
+        self.last_rollout = []                          # (player, move) pairs from the latest simulation
+        # Implicit minimax: blend backed-up static evaluations into selection
+        self.minimax_weight = minimax_weight if implicit_minimax else 0
+        self.rollout_depth = rollout_depth              # 0 scores leaves by evaluation alone
+        self.eval_scale = eval_scale                    # Material lead that maps to ~73% win chance
+        self.rollout_capture_bias = rollout_capture_bias  # Chance a rollout plays its best winning capture
+        self.tablebases = tablebases                    # Endgame tables end rollouts with the exact result
+        self.stop_event = stop_event                    # Set from another thread to cancel the search
+        self.search_stats = {}
+
+    def _is_valid_move(self, from_pos, to_pos, board):
+        """Implementation of move validation logic for a given board state"""
+        from_row, from_col = from_pos
+        to_row, to_col = to_pos
+        piece = board[from_row][from_col]
+        
+        # Basic validation
+        if not (0 <= to_row < 10 and 0 <= to_col < 9):
+            return False
+            
+        # Can't capture own pieces
+        if board[to_row][to_col] and board[to_row][to_col][0] == piece[0]:
+            return False
+        
+        # Get piece type
+        piece_type = piece[1]
+        
+        # Check specific piece movement rules
+        if piece_type in ['帥', '將']:  # General/King
+            # Check if move is within palace (3x3 grid)
+            if piece[0] == 'R':  # Red general
+                if not (7 <= to_row <= 9 and 3 <= to_col <= 5):
+                    return False
+            else:  # Black general
+                if not (0 <= to_row <= 2 and 3 <= to_col <= 5):
+                    return False
+            # Can only move one step horizontally or vertically
+            if abs(to_row - from_row) + abs(to_col - from_col) != 1:
+                return False
+        
+        # Add similar rules for other pieces...
+        
+        return True
+
+    def _is_in_check(self, color, board):
+        """Implementation of check detection for a given board state"""
+        # Find kings
+        red_king_pos = black_king_pos = None
+        for row in range(10):
+            for col in range(9):
+                piece = board[row][col]
+                if piece:
+                    if piece[1] == '帥':
+                        red_king_pos = (row, col)
+                    elif piece[1] == '將':
+                        black_king_pos = (row, col)
+        
+        if not red_king_pos or not black_king_pos:
+            return False
+        
+        # Check if kings are facing each other
+        if red_king_pos[1] == black_king_pos[1]:  # Same column
+            blocked = False
+            for row in range(red_king_pos[0] + 1, black_king_pos[0]):
+                if board[row][red_king_pos[1]]:
+                    blocked = True
+                    break
+            if not blocked:
+                return True
+        
+        # Check if king is under attack
+        king_pos = red_king_pos if color == 'red' else black_king_pos
+        attacking_color = 'B' if color == 'red' else 'R'
+        
+        for row in range(10):
+            for col in range(9):
+                piece = board[row][col]
+                if piece and piece[0] == attacking_color:
+                    if self._is_valid_move((row, col), king_pos, board):
+                        return True
+        
+        return False
+
+    def evaluate_move(self, move, board, key=None):
+        """
+        Evaluates a potential move, cached by (position key, move)
+        Args:
+            move: tuple ((from_row, from_col), (to_row, to_col))
+            board: current game board state
+            key: board's position key, if the caller already has it
+        Returns:
+            score: numeric value representing move quality
+        """
+        if key is None:
+            key = self.rules.position_key(board)
+        return self.feature_cache.get_or_compute(('evaluate_move', key, move),
+                                                 lambda: self._compute_evaluate_move(move, board))
+
+    def _compute_evaluate_move(self, move, board):
+        score = 0
+        
+        # Check if move gives check
+        if self._move_gives_check(move, board):
+            score += 50
+        
+        # Check if move restricts king mobility
+        if self._reduces_king_mobility(move, board):
+            score += 20
+        
+        # Check if move controls key squares
+        if self._controls_key_squares(move, board):
+            score += 15
+        
+        return score
+
+    def _board_after_move(self, move, board):
+        """Copy of board with the move made"""
+        from_pos, to_pos = move
+        temp_board = [row[:] for row in board]
+        temp_board[to_pos[0]][to_pos[1]] = temp_board[from_pos[0]][from_pos[1]]
+        temp_board[from_pos[0]][from_pos[1]] = None
+        return temp_board
+
+    # The single features below cost about as much as hashing the board, so only
+    # evaluate_move and _is_checkmate_position go through the feature cache
+
+    def _move_gives_check(self, move, board):
+        """Helper to check if move puts opponent in check"""
+        from_pos, to_pos = move
+        piece = board[from_pos[0]][from_pos[1]]
+        player = 'black' if piece[0] == 'B' else 'red'
+        opponent = 'red' if player == 'black' else 'black'
+        
+        # Make the move
+        temp_board = self._board_after_move(move, board)
+        
+        # Check if opponent's king is under attack
+        king_pos = self.rules.find_king(temp_board, opponent)
+        if king_pos:
+            return bool(self.rules.attackers(temp_board, king_pos, player))
+        return False
+
+    def _reduces_king_mobility(self, move, board):
+        """Helper to check if move cuts the opponent king's steps to squares we don't attack"""
+        from_pos, to_pos = move
+        piece = board[from_pos[0]][from_pos[1]]
+        player = 'black' if piece[0] == 'B' else 'red'
+        opponent = 'red' if player == 'black' else 'black'
+        
+        # Find opponent's king
+        king_pos = self.rules.find_king(board, opponent)
+        if not king_pos:
+            return False
+        
+        # Count king steps to squares we don't attack, before and after our move
+        moves_before = self._count_safe_king_steps(board, king_pos, player)
+        temp_board = self._board_after_move(move, board)
+        if temp_board[king_pos[0]][king_pos[1]] != board[king_pos[0]][king_pos[1]]:
+            return False  # The king itself was captured
+        moves_after = self._count_safe_king_steps(temp_board, king_pos, player)
+        
+        return moves_after < moves_before
+
+    def _count_safe_king_steps(self, board, king_pos, attacking_color):
+        """Count king steps inside the palace that land on unattacked squares"""
+        count = 0
+        for to_pos in self.rules.piece_moves(board, king_pos):
+            if not self.rules.attackers(board, to_pos, attacking_color):
+                count += 1
+        return count
+
+    def _controls_key_squares(self, move, board):
+        """Helper to check if move controls important squares"""
+        from_pos, to_pos = move
+        piece = board[from_pos[0]][from_pos[1]]
+        opponent = 'red' if piece[0] == 'B' else 'black'
+        
+        # Define key squares based on opponent's color
+        key_squares = []
+        if opponent == 'red':
+            # Key squares around red king's palace
+            key_squares = [(9, 3), (9, 4), (9, 5), (8, 3), (8, 4), (8, 5), (7, 3), (7, 4), (7, 5)]
+        else:
+            # Key squares around black king's palace
+            key_squares = [(0, 3), (0, 4), (0, 5), (1, 3), (1, 4), (1, 5), (2, 3), (2, 4), (2, 5)]
+        
+        # Check if move controls any key squares
+        if to_pos in key_squares:
+            return True
+            
+        # Check if piece can attack key squares from new position
+        temp_board = self._board_after_move(move, board)
+        for square in self.rules.piece_moves(temp_board, to_pos):
+            if square in key_squares:
+                return True
+                
+        return False
+
+    def get_promising_moves(self, board):
+        """
+        Identifies promising moves for the current position
+        Args:
+            board: current game board state
+        Returns:
+            list of moves sorted by priority
+        """
+        moves = []
+        
+        # 1. First check for immediate checkmate moves
+        checkmate_moves = self._find_checkmate_moves(board)
+        if checkmate_moves:
+            # Filter out moves that put own king in check
+            valid_checkmate_moves = self._filter_valid_moves(checkmate_moves, board)
+            if valid_checkmate_moves:
+                return valid_checkmate_moves
+        
+        # 2. Check for moves that give check
+        check_moves = self._find_check_moves(board)
+        # Filter out invalid check moves
+        valid_check_moves = self._filter_valid_moves(check_moves, board)
+        moves.extend(valid_check_moves)
+        
+        # 3. Look for moves that restrict king mobility
+        trap_moves = self._find_king_trap_moves(board)
+        valid_trap_moves = self._filter_valid_moves(trap_moves, board)
+        moves.extend(valid_trap_moves)
+        
+        # 4. Add moves that control key squares
+        control_moves = self._find_control_moves(board)
+        valid_control_moves = self._filter_valid_moves(control_moves, board)
+        moves.extend(valid_control_moves)
+        
+        # If no special moves found, get all valid moves
+        if not moves:
+            all_moves = self._get_all_valid_moves(board)
+            moves = self._filter_valid_moves(all_moves, board)
+        
+        return moves
+
+    def _find_checkmate_moves(self, board):
+        """Helper to find moves that lead to immediate checkmate"""
+        checkmate_moves = []
+        player = self.root.current_player
+        zobrist = BoardRules.ZOBRIST
+        board_key = self.rules.position_key(board)
+        
+        # Try each possible move
+        for from_row in range(10):
+            for from_col in range(9):
+                piece = board[from_row][from_col]
+                if piece and piece[0] == player[0].upper():
+                    for to_row in range(10):
+                        for to_col in range(9):
+                            move = ((from_row, from_col), (to_row, to_col))
+                            if self.root._is_valid_move(move[0], move[1]):
+                                # Make temporary move
+                                temp_board = [row[:] for row in board]
+                                temp_board[to_row][to_col] = piece
+                                temp_board[from_row][from_col] = None
+                                # Key of the new board, updated from board_key rather than rehashed
+                                key = (board_key ^ zobrist[piece][from_row * 9 + from_col]
+                                       ^ zobrist[piece][to_row * 9 + to_col])
+                                if board[to_row][to_col]:
+                                    key ^= zobrist[board[to_row][to_col]][to_row * 9 + to_col]
+                                
+                                # Check if this creates checkmate
+                                if self._is_checkmate_position(temp_board, player, key):
+                                    checkmate_moves.append(move)
+                                    
+        return checkmate_moves
+
+    def _find_check_moves(self, board):
+        """Helper to find moves that give check"""
+        check_moves = []
+        for from_row in range(10):
+            for from_col in range(9):
+                piece = board[from_row][from_col]
+                if piece and piece[0] == self.root.current_player[0].upper():
+                    for to_row in range(10):
+                        for to_col in range(9):
+                            move = ((from_row, from_col), (to_row, to_col))
+                            if self.root._is_valid_move(move[0], move[1]):
+                                if self._move_gives_check(move, board):
+                                    check_moves.append(move)
+        return check_moves
+
+    def _find_king_trap_moves(self, board):
+        """Helper to find moves that restrict opponent king's mobility"""
+        trap_moves = []
+        for from_row in range(10):
+            for from_col in range(9):
+                piece = board[from_row][from_col]
+                if piece and piece[0] == self.root.current_player[0].upper():
+                    for to_row in range(10):
+                        for to_col in range(9):
+                            move = ((from_row, from_col), (to_row, to_col))
+                            if self.root._is_valid_move(move[0], move[1]):
+                                if self._reduces_king_mobility(move, board):
+                                    trap_moves.append(move)
+        return trap_moves
+
+    def _find_control_moves(self, board):
+        """Helper to find moves that control key squares"""
+        control_moves = []
+        for from_row in range(10):
+            for from_col in range(9):
+                piece = board[from_row][from_col]
+                if piece and piece[0] == self.root.current_player[0].upper():
+                    for to_row in range(10):
+                        for to_col in range(9):
+                            move = ((from_row, from_col), (to_row, to_col))
+                            if self.root._is_valid_move(move[0], move[1]):
+                                if self._controls_key_squares(move, board):
+                                    control_moves.append(move)
+        return control_moves
+
+    def _get_all_valid_moves(self, board):
+        """Helper to get all valid moves that don't put own king in check"""
+        moves = []
+        for from_row in range(10):
+            for from_col in range(9):
+                piece = board[from_row][from_col]
+                if piece and piece[0] == self.root.current_player[0].upper():
+                    for to_row in range(10):
+                        for to_col in range(9):
+                            move = ((from_row, from_col), (to_row, to_col))
+                            if self.root._is_valid_move(move[0], move[1]):
+                                moves.append(move)
+        
+        # Filter out moves that put own king in check
+        return self._filter_valid_moves(moves, board)
+
+    def _is_checkmate_position(self, board, player, key=None):
+        """Helper to check if player has checkmated the opponent on this board (key: board's position key)"""
+        if key is None:
+            key = self.rules.position_key(board)
+        return self.feature_cache.get_or_compute(('checkmate', key, player),
+                                                 lambda: self._compute_is_checkmate_position(board, player))
+
+    def _compute_is_checkmate_position(self, board, player):
+        opponent = 'red' if player == 'black' else 'black'
+        # Trial evasions are made and undone in place on the given board
+        return self.rules.is_checkmate(board, opponent)
+
+    def make_move(self):
+        # Known endgames are played straight from the tables
+        piece_count = sum(1 for row in self.root.board for piece in row if piece)
+        if self.tablebases and piece_count <= self.tablebases.max_pieces:
+            move = self.tablebases.best_move(self.root.board, self.root.current_player)
+            if move:
+                self.search_stats = {'iterations': 0, 'simulation_limit': self.simulation_limit,
+                                     'stop_reason': 'tablebase', 'saved_iterations': self.simulation_limit}
+                return move
+
+        # Main MCTS loop
+        stop_reason = None
+        iterations = 0
+        for iteration in range(self.simulation_limit):
+            node = self.select_node(self.root)
+            
+            if node.untried_moves and node.visits > 0:
+                node = self.expand(node)
+            
+            result = self.simulate(node)
+            self.backpropagate(node, result)
+            iterations = iteration + 1
+
+            # Stop early if the remaining simulations can't change the answer
+            stop_reason = self._check_stop_rules(self.simulation_limit - iterations)
+            if stop_reason:
+                break
+            if self.stop_event is not None and self.stop_event.is_set():
+                stop_reason = 'cancelled'
+                break
+
+        MCTS.stop_rule_counts['searches'] += 1
+        if stop_reason:
+            MCTS.stop_rule_counts[stop_reason] += 1
+        self.search_stats = {
+            'iterations': iterations,
+            'simulation_limit': self.simulation_limit,
+            'stop_reason': stop_reason,
+            'saved_iterations': self.simulation_limit - iterations,
+            'stop_rule_counts': dict(MCTS.stop_rule_counts),
+            'eval_cache': self.evaluator.cache.stats()
+        }
+        
+        # Choose the best move
+        if not self.root.children:
+            return None
+        best_child = max(self.root.children, key=lambda c: c.visits)
+        return best_child.move
+
+    def analyze(self, num_moves=3, pv_length=8):
+        """
+        Top root moves from the tree built by the last make_move, without searching again
+        Args:
+            num_moves: number of candidate moves to return
+            pv_length: longest principal variation to report per move
+        Returns:
+            list of dicts, most visited first: move, visits, win_rate (for the
+            side to move at the root, None if unvisited) and pv, the line
+            following the most visited child at each level
+        """
+        analysis = []
+        for child in sorted(self.root.children, key=lambda c: c.visits, reverse=True)[:num_moves]:
+            pv = [child.move]
+            node = child
+            while node.children and len(pv) < pv_length:
+                node = max(node.children, key=lambda c: c.visits)
+                if node.visits == 0:
+                    break
+                pv.append(node.move)
+            analysis.append({
+                'move': child.move,
+                'visits': child.visits,
+                'win_rate': child.wins / child.visits if child.visits else None,
+                'pv': pv
+            })
+        return analysis
+
+    def _check_stop_rules(self, remaining):
+        """
+        Decide whether the search can stop before the simulation limit
+        Args:
+            remaining: number of simulations left in the budget
+        Returns:
+            name of the stop rule that fired, or None to keep searching
+        """
+        if remaining <= 0 or len(self.root.children) < 1:
+            return None
+
+        # Unexpanded root moves count as children with zero visits
+        visits = sorted((child.visits for child in self.root.children), reverse=True)
+        if self.root.untried_moves:
+            visits.append(0)
+        if len(visits) < 2:
+            # Only one legal move, nothing to compare against
+            return 'obvious_move' if self.early_stop else None
+
+        # Obvious move: the runner-up can't catch up even if it gets every remaining visit
+        if self.early_stop and visits[0] - visits[1] > remaining:
+            return 'obvious_move'
+
+        # Confidence bound: the best move's lower bound beats every other move's upper bound
+        if self.confidence_stop and not self.root.untried_moves:
+            best_child = max(self.root.children, key=lambda c: c.visits)
+            if best_child.visits < self.confidence_min_visits:
+                return None
+            best_lower = self._win_rate_bound(best_child, -self.confidence_z)
+            for child in self.root.children:
+                if child is best_child:
+                    continue
+                if child.visits == 0 or self._win_rate_bound(child, self.confidence_z) >= best_lower:
+                    return None
+            return 'confidence_bound'
+
+        return None
+
+    def _win_rate_bound(self, node, z):
+        """Normal-approximation bound on a node's win rate (z < 0 gives the lower bound)"""
+        win_rate = node.wins / node.visits
+        # Floor the variance so a streak of identical results isn't treated as certain
+        variance = max(win_rate * (1 - win_rate), 0.05)
+        return win_rate + z * math.sqrt(variance / node.visits)
+     
+    def select_node(self, node):
+        while node.children and not node.untried_moves:
+            # Modified UCT that considers checkmate potential
+            node = node.get_best_child(c=1.41, checkmate_weight=0.3, rave_k=self.rave_k,
+                                       minimax_weight=self.minimax_weight)
+            if not node:  # Add safety check
+                break
+        return node
+    
+    def expand(self, node):
+        move = random.choice(node.untried_moves)
+        node.untried_moves.remove(move)
+        
+        # Create new board state
+        new_board = [row[:] for row in node.board]
+        from_pos, to_pos = move
+        
+        # Make the move
+        piece = new_board[from_pos[0]][from_pos[1]]
+        captured = new_board[to_pos[0]][to_pos[1]]
+        new_board[to_pos[0]][to_pos[1]] = piece
+        new_board[from_pos[0]][from_pos[1]] = None
+        new_player = 'red' if node.current_player == 'black' else 'black'
+        
+        # Create new node, updating the parent's position key instead of rescanning the board
+        child = MCTSNode(new_board, new_player, parent=node, move=move)
+        zobrist = BoardRules.ZOBRIST
+        child.key = node.key ^ zobrist[piece][from_pos[0] * 9 + from_pos[1]] ^ zobrist[piece][to_pos[0] * 9 + to_pos[1]]
+        if captured:
+            child.key ^= zobrist[captured][to_pos[0] * 9 + to_pos[1]]
+        node.children.append(child)
+        if self.minimax_weight:
+            child.eval_value = self._static_win_probability(new_board, node.current_player, child.key)
+            child.minimax_value = child.eval_value
+        return child
+
+    def _static_win_probability(self, board, color, key=None):
+        """Static evaluation for color squashed into a 0..1 win probability (key: board's position key)"""
+        opponent = 'red' if color == 'black' else 'black'
+        # Tree moves aren't checked for king safety, so a king can be missing
+        if not self.rules.find_king(board, color):
+            return 0.0
+        if not self.rules.find_king(board, opponent):
+            return 1.0
+        balance = self.evaluator.evaluate(board, color, key)
+        return 1 / (1 + math.exp(-balance / self.eval_scale))
+
+    def simulate(self, node):
+        board = [row[:] for row in node.board]
+        current_player = node.current_player
+        moves_count = 0
+        max_moves = self.rollout_depth  # Prevent infinite games
+        self.last_rollout = []
+
+        if max_moves == 0:
+            # No playout: score the leaf by its evaluation (1 = black wins)
+            return self._static_win_probability(board, 'black', node.key)
+
+        # Red-minus-black score, updated move by move instead of rescanning the board
+        score = self.evaluator.evaluate(board, key=node.key)
+        piece_count = sum(1 for row in board for piece in row if piece)
+        # Tree moves aren't checked for king safety, so a king may already be gone; the tables need both
+        kings = sum(1 for row in board for piece in row if piece in ('R帥', 'B將'))
+        
+        while moves_count < max_moves:
+            # Once the tables cover the position, the rollout's result is known
+            if self.tablebases and kings == 2 and piece_count <= self.tablebases.max_pieces:
+                result = self.tablebases.probe(board, current_player)
+                if result:
+                    if result[0] == 0:
+                        return 0.5
+                    winner = current_player if result[0] > 0 else ('red' if current_player == 'black' else 'black')
+                    return 1 if winner == 'black' else 0
+
+            # Get all valid moves including check validation
+            valid_moves = self.rules.legal_moves(board, current_player)
+            
+            if not valid_moves:
+                # No legal moves: the side to move has lost
+                return 1 if current_player == 'red' else 0
+            
+            # Make random valid move, or sometimes the best capture that wins material
+            move = None
+            if self.rollout_capture_bias and random.random() < self.rollout_capture_bias:
+                move = self._best_winning_capture(board, valid_moves)
+            from_pos, to_pos = move or random.choice(valid_moves)
+            self.last_rollout.append((current_player, (from_pos, to_pos)))
+            piece = board[from_pos[0]][from_pos[1]]
+            captured = board[to_pos[0]][to_pos[1]]
+            score += self.evaluator.move_delta((from_pos, to_pos), piece, captured)
+            if captured:
+                piece_count -= 1
+                if captured in ('R帥', 'B將'):
+                    kings -= 1
+            board[to_pos[0]][to_pos[1]] = piece
+            board[from_pos[0]][from_pos[1]] = None
+            current_player = 'red' if current_player == 'black' else 'black'
+            moves_count += 1
+
+        # Improve evaluation to consider king safety
+        if self.rules.is_in_check(board, 'black'):
+            score += self.ROLLOUT_CHECK_PENALTY
+        if self.rules.is_in_check(board, 'red'):
+            score -= self.ROLLOUT_CHECK_PENALTY
+            
+        return 1 if score < 0 else 0
+
+    def _best_winning_capture(self, board, moves):
+        """Capture with the highest positive static exchange value, or None"""
+        best_move = None
+        best_gain = 0
+        for move in moves:
+            to_pos = move[1]
+            if board[to_pos[0]][to_pos[1]]:
+                gain = self.rules.static_exchange(board, move)
+                if gain > best_gain:
+                    best_gain = gain
+                    best_move = move
+        return best_move
+
+    def backpropagate(self, node, result):
+        # Moves played after the current node: the rollout, plus tree moves below it
+        played = list(self.last_rollout) if self.rave_k else []
+        while node:
+            node.visits += 1
+            # Credit the player who made the move into this node, so that
+            # get_best_child at the parent maximizes the mover's win rate
+            if node.current_player == 'red':
+                node.wins += result
+            else:
+                node.wins += (1 - result)
+
+            if played:
+                self._update_amaf(node, played, result)
+            if self.rave_k and node.move:
+                mover = 'red' if node.current_player == 'black' else 'black'
+                played.insert(0, (mover, node.move))
+            if self.minimax_weight and node.children:
+                self._backup_minimax(node)
+            node = node.parent
+
+    def _backup_minimax(self, node):
+        """Negamax backup: our value is one minus the opponent's best reply"""
+        best_reply = max((child.minimax_value for child in node.children
+                          if child.minimax_value is not None), default=None)
+        if best_reply is not None:
+            node.minimax_value = 1 - best_reply
+
+    def _update_amaf(self, node, played, result):
+        """Count every move node.current_player made later in the simulation as if played first"""
+        player_result = result if node.current_player == 'black' else 1 - result
+        seen = set()
+        for player, move in played:
+            if player == node.current_player and move not in seen:
+                seen.add(move)
+                node.amaf_visits[move] += 1
+                node.amaf_wins[move] += player_result
+       
+    def _filter_valid_moves(self, moves, board):
+        """Filter out moves that would put own king in check"""
+        valid_moves = []
+        for move in moves:
+            from_pos, to_pos = move
+            # Make temporary move
+            temp_board = [row[:] for row in board]
+            moving_piece = temp_board[from_pos[0]][from_pos[1]]
+            target_piece = temp_board[to_pos[0]][to_pos[1]]
+            
+            # Try the move
+            temp_board[to_pos[0]][to_pos[1]] = moving_piece
+            temp_board[from_pos[0]][from_pos[1]] = None
+            
+            # Create temporary node to check if move is safe
+            temp_node = MCTSNode(temp_board, self.root.current_player)
+            if not temp_node._is_in_check(self.root.current_player):
+                valid_moves.append(move)
+        
+        return valid_moves       
+       
+class TranspositionTable:
+    """
+    Fixed-size table of alpha-beta results keyed by Zobrist position key.
+    Each bucket holds two entries: a depth-preferred slot that keeps the
+    deepest result, and an always-replace slot for the newest one.
+    Entries are packed into a flat array of 64-bit integers (key, data),
+    so the table can live in any writable buffer, including shared memory.
+    The key slot holds key ^ data, so an entry torn by two processes
+    writing at once fails the key check instead of returning bad data.
+    """
+
+    EXACT, LOWER, UPPER = 0, 1, 2
+    BUCKET_BYTES = 32       # 2 entries x (key, data) x 8 bytes
+    SCORE_BIAS = 1 << 19    # Scores are stored offset to stay non-negative
+
+    def __init__(self, size_mb=16, buffer=None):
+        self.num_buckets = max(1, int(size_mb * 1024 * 1024) // self.BUCKET_BYTES)
+        if buffer is None:
+            buffer = bytearray(self.num_buckets * self.BUCKET_BYTES)
+        self.buffer = buffer
+        self.table = memoryview(buffer)[:self.num_buckets * self.BUCKET_BYTES].cast('q')
+        self.age = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def new_search(self):
+        """Start a new search so entries from earlier moves lose their depth priority"""
+        self.age = (self.age + 1) & 0xFF
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    def clear(self):
+        for i in range(len(self.table)):
+            self.table[i] = 0
+
+    def release(self):
+        """Drop the view of the buffer (needed before closing shared memory)"""
+        self.table.release()
+
+    def encode_move(self, move):
+        if move is None:
+            return 0
+        (from_row, from_col), (to_row, to_col) = move
+        return (from_row * 9 + from_col) * 90 + (to_row * 9 + to_col) + 1
+
+    def decode_move(self, code):
+        if code == 0:
+            return None
+        from_index, to_index = divmod(code - 1, 90)
+        return (divmod(from_index, 9), divmod(to_index, 9))
+
+    def probe(self, key):
+        """Return (depth, flag, score, move) stored for key, or None"""
+        self.probes += 1
+        base = (key % self.num_buckets) * 4
+        table = self.table
+        for slot in (base, base + 2):
+            data = table[slot + 1]
+            if table[slot] ^ data == key:
+                self.hits += 1
+                return ((data >> 16) & 0x7F,
+                        (data >> 14) & 0x3,
+                        ((data >> 31) & 0xFFFFF) - self.SCORE_BIAS,
+                        self.decode_move(data & 0x3FFF))
+        return None
+
+    def store(self, key, depth, flag, score, move):
+        self.stores += 1
+        base = (key % self.num_buckets) * 4
+        table = self.table
+        data = (self.encode_move(move)
+                | flag << 14
+                | min(depth, 0x7F) << 16
+                | self.age << 23
+                | (score + self.SCORE_BIAS) << 31)
+
+        # Depth-preferred slot: take it if it's free, ours, stale or shallower
+        old_data = table[base + 1]
+        old_key = table[base] ^ old_data
+        old_depth = (old_data >> 16) & 0x7F
+        old_age = (old_data >> 23) & 0xFF
+        if old_key == 0 or old_key == key or old_age != self.age or depth >= old_depth:
+            if old_key and old_key != key:
+                # Demote the previous occupant to the always-replace slot
+                table[base + 2] = old_key ^ old_data
+                table[base + 3] = old_data
+            table[base] = key ^ data
+            table[base + 1] = data
+        else:
+            table[base + 2] = key ^ data
+            table[base + 3] = data
+
+    def occupancy(self, sample=1000):
+        """Fraction of entries in use, estimated from the first buckets"""
+        sample = min(sample, self.num_buckets)
+        used = 0
+        for bucket in range(sample):
+            used += (self.table[bucket * 4] != 0) + (self.table[bucket * 4 + 2] != 0)
+        return used / (2 * sample)
+
+    def stats(self):
+        return {
+            'size_mb': self.num_buckets * self.BUCKET_BYTES / (1024 * 1024),
+            'probes': self.probes,
+            'hits': self.hits,
+            'hit_rate': self.hits / self.probes if self.probes else 0.0,
+            'stores': self.stores,
+            'occupancy': self.occupancy()
+        }
+
+class AlphaBeta:
+    """
+    Negamax alpha-beta search with principal variation search (PVS).
+    Takes the same game_state as MCTS and returns a move from make_move(),
+    deepening one ply at a time until max_time runs out.
+    """
+
+    MATE_SCORE = 100000
+    MAX_PLY = 128
+    MAX_TABLEBASE_PLIES = 254   # Longest distance to mate an EndgameTable byte can hold
+    # Scores past this are mates, found by search or from the endgame tables; the band has to
+    # cover a tablebase mate probed MAX_PLY deep so the TT stores it relative to its node
+    MATE_BOUND = MATE_SCORE - MAX_PLY - MAX_TABLEBASE_PLIES
+    DELTA_MARGIN = 200          # Slack for positional gains when delta pruning captures
+    NULL_MOVE_MIN_ATTACKERS = 2 # Chariots, horses and cannons needed before trying a null move
+    ASPIRATION_WINDOW = 50      # Initial half-width of the window around the previous score
+    PARTIAL_ITERATION_FRACTION = 0.5
+
+    def __init__(self, game_state, max_time=5.0, max_depth=32, transposition_table=None, tt_size_mb=16,
+                 quiescence=True, quiescence_check_plies=2, null_move=True, late_move_reductions=True,
+                 start_depth=1, tablebases=None, stop_event=None):
+        self.board = [row[:] for row in game_state.board]
+        self.current_player = game_state.current_player
+        self.rules = BoardRules()
+        # Pass a table in to keep results between moves
+        self.tt = transposition_table or TranspositionTable(size_mb=tt_size_mb)
+        self.hash = self.rules.position_key(self.board, self.current_player)
+        self.hash_stack = []
+        self.move_stack = []
+        # Red-minus-black evaluation, updated incrementally by _make/_unmake
+        self.evaluator = Evaluator()
+        self.score = self.evaluator.evaluate(self.board)
+        self.score_stack = []
+        # Endgame tables are probed once few enough pieces are left
+        self.tablebases = tablebases
+        self.piece_count = sum(1 for row in self.board for piece in row if piece)
+        # Quiet-move ordering tables, kept across iterative-deepening iterations:
+        # two killer moves per ply, from-to history scores, and the reply that
+        # last refuted each previous move (countermove)
+        self.killers = [[None, None] for _ in range(self.MAX_PLY + 1)]
+        self.history = [[0] * 90 for _ in range(90)]
+        self.countermoves = [[None] * 90 for _ in range(90)]
+        self.max_time = max_time
+        self.max_depth = max_depth
+        self.start_depth = start_depth              # Lazy SMP helpers start at staggered depths
+        self.quiescence = quiescence
+        # Answer checks with full evasions for this many plies into quiescence (0 = captures only)
+        self.quiescence_check_plies = quiescence_check_plies
+        self.null_move = null_move
+        self.late_move_reductions = late_move_reductions
+        self.nodes = 0
+        self.deadline = None
+        self.stopped = False
+        self.stop_event = stop_event                # Set from another thread to cancel the search
+        self.search_stats = {}
+        # Deepest result for each fully searched root move: move -> (score, TT flag, depth)
+        self.root_scores = {}
+        self.best_move = None
+
+    def make_move(self):
+        """
+        Iterative deepening driver.
+        Each depth is searched in an aspiration window around the previous
+        score, widening on a fail. If time runs out mid-iteration, the best
+        root move proven so far in that iteration is kept. A new depth is only
+        started if the effective branching factor predicts it will finish.
+        """
+        start_time = time.time()
+        self.deadline = start_time + self.max_time
+        self.nodes = 0
+        self.stopped = False
+        self.root_scores = {}
+        self.tt.new_search()
+        infinity = self.MATE_SCORE + 1
+
+        # Known endgames are played straight from the tables
+        if self.tablebases and self.piece_count <= self.tablebases.max_pieces:
+            best_move = self.tablebases.best_move(self.board, self.current_player)
+            if best_move:
+                self.search_stats = {'depth': 0, 'score': self._tablebase_score(self.current_player, 0),
+                                     'nodes': 0, 'time': time.time() - start_time, 'nps': 0,
+                                     'stop_reason': 'tablebase', 'tt': self.tt.stats()}
+                self.best_move = best_move
+                return best_move
+
+        best_move = None
+        best_score = None
+        completed_depth = 0
+        partial_iteration = False
+        researches = 0
+        branching_factor = None
+        stop_reason = 'max_depth'
+        nodes_per_depth = []
+
+        for depth in range(self.start_depth, self.max_depth + 1):
+            iteration_start = time.time()
+            iteration_nodes = self.nodes
+
+            window = self.ASPIRATION_WINDOW
+            if depth >= 3 and best_score is not None and abs(best_score) < self.MATE_BOUND:
+                alpha, beta = best_score - window, best_score + window
+            else:
+                alpha, beta = -infinity, infinity
+
+            while True:
+                move, score = self._search_root(depth, alpha, beta)
+                if self.stopped:
+                    break
+                if score <= alpha and alpha > -infinity:
+                    alpha = max(score - window, -infinity)      # Failed low, widen downwards
+                elif score >= beta and beta < infinity:
+                    beta = min(score + window, infinity)        # Failed high, widen upwards
+                else:
+                    break
+                window *= 4
+                researches += 1
+
+            if self.stopped:
+                # Use the unfinished iteration's move if it beat the window's floor
+                if move is not None and score > alpha:
+                    best_move, best_score = move, score
+                    partial_iteration = True
+                stop_reason = 'cancelled' if self.stop_event and self.stop_event.is_set() else 'time'
+                break
+
+            best_move, best_score = move, score
+            completed_depth = depth
+            # No point searching deeper once a forced mate is found
+            if move is None or abs(score) >= self.MATE_SCORE - self.max_depth:
+                stop_reason = 'mate'
+                break
+
+            # Predict the next iteration's cost from the growth in node counts,
+            # averaged over two plies to smooth out the odd/even depth effect
+            nodes_per_depth.append(self.nodes - iteration_nodes)
+            if len(nodes_per_depth) >= 3 and nodes_per_depth[-3]:
+                branching_factor = max(math.sqrt(nodes_per_depth[-1] / nodes_per_depth[-3]), 1.5)
+                predicted_time = (time.time() - iteration_start) * branching_factor
+                # An unfinished iteration still yields a move, so start it if
+                # at least PARTIAL_ITERATION_FRACTION of it should fit
+                if predicted_time * self.PARTIAL_ITERATION_FRACTION > self.deadline - time.time():
+                    stop_reason = 'predicted'
+                    break
+
+        # Even if no depth finished, fall back to any legal move
+        if best_move is None:
+            moves = self.rules.legal_moves(self.board, self.current_player)
+            best_move = moves[0] if moves else None
+
+        elapsed = time.time() - start_time
+        self.search_stats = {
+            'depth': completed_depth,
+            'score': best_score,
+            'nodes': self.nodes,
+            'time': elapsed,
+            'nps': self.nodes / elapsed if elapsed > 0 else 0,
+            'partial_iteration': partial_iteration,
+            'aspiration_researches': researches,
+            'branching_factor': branching_factor,
+            'stop_reason': stop_reason,
+            'tt': self.tt.stats()
+        }
+        self.best_move = best_move
+        return best_move
+
+    def _search_root(self, depth, alpha, beta):
+        """
+        Search all root moves to the given depth within (alpha, beta).
+        Returns (best move, score); if the search stops early, the best of
+        the root moves that were fully searched.
+        """
+        color = self.current_player
+        opponent = 'red' if color == 'black' else 'black'
+        original_alpha = alpha
+        best_move = None
+        best_score = -self.MATE_SCORE - 1
+
+        entry = self.tt.probe(self.hash)
+        tt_move = entry[3] if entry else None
+
+        for move in self._ordered_moves(color, tt_move, ply=0):
+            captured = self._make(move)
+            if self.rules.is_in_check(self.board, color):
+                self._unmake(move, captured)
+                continue
+
+            if best_move is None:
+                score = -self.search(depth - 1, -beta, -alpha, opponent, 1)
+            else:
+                # PVS: prove the move is no better with a null window, re-search if it is
+                score = -self.search(depth - 1, -alpha - 1, -alpha, opponent, 1)
+                if alpha < score < beta:
+                    score = -self.search(depth - 1, -beta, -alpha, opponent, 1)
+            self._unmake(move, captured)
+
+            if self.stopped:
+                break
+            # Moves after the first are only proven against alpha, so most scores are bounds
+            if score <= alpha:
+                self.root_scores[move] = (score, TranspositionTable.UPPER, depth)
+            elif score >= beta:
+                self.root_scores[move] = (score, TranspositionTable.LOWER, depth)
+            else:
+                self.root_scores[move] = (score, TranspositionTable.EXACT, depth)
+            if score > best_score:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+
+        if best_move is not None and not self.stopped:
+            if best_score <= original_alpha:
+                flag = TranspositionTable.UPPER
+            elif best_score >= beta:
+                flag = TranspositionTable.LOWER
+            else:
+                flag = TranspositionTable.EXACT
+            self.tt.store(self.hash, depth, flag, best_score, best_move)
+        return best_move, best_score
+
+    def analyze(self, num_moves=3, pv_length=8):
+        """
+        Top root moves from the last make_move, without searching again
+        Args:
+            num_moves: number of candidate moves to return
+            pv_length: longest principal variation to report per move
+        Returns:
+            list of dicts, the chosen move first, then deepest and best
+            scored: move, score (for the side to move at the root), bound
+            ('exact', 'upper' or 'lower'), depth and pv, the move followed
+            by the transposition table's best replies
+        """
+        bounds = {TranspositionTable.EXACT: 'exact', TranspositionTable.UPPER: 'upper',
+                  TranspositionTable.LOWER: 'lower'}
+        ranked = sorted(self.root_scores.items(),
+                        key=lambda item: (item[0] == self.best_move, item[1][2], item[1][0]), reverse=True)
+        analysis = []
+        for move, (score, flag, depth) in ranked[:num_moves]:
+            analysis.append({
+                'move': move,
+                'score': score,
+                'bound': bounds[flag],
+                'depth': depth,
+                'pv': self._principal_variation(move, pv_length)
+            })
+        return analysis
+
+    def _principal_variation(self, move, max_length):
+        """Play move, then follow the transposition table's stored moves while they stay legal"""
+        color = self.current_player
+        played = []
+        seen = {self.hash}
+        while move is not None and len(played) < max_length:
+            played.append((move, self._make(move)))
+            color = 'red' if color == 'black' else 'black'
+            if self.hash in seen:
+                break  # Repetition
+            seen.add(self.hash)
+            entry = self.tt.probe(self.hash)
+            move = entry[3] if entry else None
+            # A key collision can hand back a move from another position
+            if move is not None and move not in self.rules.legal_moves(self.board, color):
+                move = None
+
+        pv = [move for move, _ in played]
+        for move, captured in reversed(played):
+            self._unmake(move, captured)
+        return pv
+
+    def search(self, depth, alpha, beta, color, ply, allow_null=True):
+        """
+        Negamax alpha-beta with principal variation search
+        Args:
+            depth: remaining plies
+            alpha, beta: search window from color's point of view
+            color: side to move
+            ply: distance from the root (used to prefer shorter mates)
+            allow_null: False right after a null move, so two are never played in a row
+        Returns:
+            score from color's point of view
+        """
+        self.nodes += 1
+        if self.nodes & 255 == 0 and self._out_of_time():
+            self.stopped = True
+        if self.stopped:
+            return 0
+
+        # Exact result from the endgame tables
+        if self.tablebases and self.piece_count <= self.tablebases.max_pieces:
+            score = self._tablebase_score(color, ply)
+            if score is not None:
+                return score
+
+        if depth <= 0:
+            if self.quiescence:
+                return self.quiesce(alpha, beta, color, ply, 0)
+            return self.evaluate(color)
+
+        # Transposition table: cut off on a deep enough bound, otherwise use its move first
+        original_alpha = alpha
+        entry = self.tt.probe(self.hash)
+        tt_move = None
+        if entry:
+            tt_depth, tt_flag, tt_score, tt_move = entry
+            if tt_depth >= depth:
+                tt_score = self._score_from_tt(tt_score, ply)
+                if tt_flag == TranspositionTable.EXACT:
+                    return tt_score
+                if tt_flag == TranspositionTable.LOWER and tt_score >= beta:
+                    return tt_score
+                if tt_flag == TranspositionTable.UPPER and tt_score <= alpha:
+                    return tt_score
+
+        opponent = 'red' if color == 'black' else 'black'
+        in_check = self.rules.is_in_check(self.board, color)
+
+        # Null-move pruning: if passing still fails high, a real move will too.
+        # Skipped in check, near mate scores, and with too few attackers left,
+        # where zugzwang makes passing unrealistically good
+        if (self.null_move and allow_null and depth >= 3 and not in_check
+                and abs(beta) < self.MATE_BOUND
+                and self._count_attackers(color) >= self.NULL_MOVE_MIN_ATTACKERS):
+            reduction = 3 if depth >= 6 else 2
+            self._make_null()
+            score = -self.search(depth - 1 - reduction, -beta, -beta + 1, opponent, ply + 1, allow_null=False)
+            self._unmake_null()
+            if self.stopped:
+                return 0
+            if score >= beta:
+                return beta
+
+        best_score = -self.MATE_SCORE + ply
+        best_move = None
+        has_legal_move = False
+        legal_moves = 0
+        killers = self.killers[ply]
+
+        for move in self._ordered_moves(color, tt_move, ply=ply):
+            captured = self._make(move)
+            if self.rules.is_in_check(self.board, color):
+                self._unmake(move, captured)
+                continue
+            legal_moves += 1
+
+            if not has_legal_move:
+                score = -self.search(depth - 1, -beta, -alpha, opponent, ply + 1)
+            else:
+                # Late-move reductions: quiet moves ordered late are searched shallower first
+                reduction = 0
+                if (self.late_move_reductions and depth >= 3 and legal_moves > 3
+                        and not in_check and not captured
+                        and move != tt_move and move not in killers
+                        and not self.rules.is_in_check(self.board, opponent)):
+                    reduction = 2 if (legal_moves > 8 and depth >= 5) else 1
+
+                score = -self.search(depth - 1 - reduction, -alpha - 1, -alpha, opponent, ply + 1)
+                if reduction and score > alpha:
+                    # The reduced search beat alpha, verify at full depth
+                    score = -self.search(depth - 1, -alpha - 1, -alpha, opponent, ply + 1)
+                if alpha < score < beta:
+                    score = -self.search(depth - 1, -beta, -alpha, opponent, ply + 1)
+            has_legal_move = True
+            self._unmake(move, captured)
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                if not captured:
+                    self._record_quiet_cutoff(move, depth, ply)
+                break
+
+        if self.stopped:
+            return 0
+
+        # No legal moves loses in xiangqi, whether checkmated or stalemated
+        if best_score <= original_alpha:
+            flag = TranspositionTable.UPPER
+        elif best_score >= beta:
+            flag = TranspositionTable.LOWER
+        else:
+            flag = TranspositionTable.EXACT
+        self.tt.store(self.hash, depth, flag, self._score_to_tt(best_score, ply), best_move)
+        return best_score
+
+    def quiesce(self, alpha, beta, color, ply, qply):
+        """
+        Search captures only until the position is quiet, so leaves aren't
+        scored in the middle of an exchange.
+        Args:
+            alpha, beta: search window from color's point of view
+            color: side to move
+            ply: distance from the root
+            qply: plies already spent in quiescence
+        Returns:
+            score from color's point of view
+        """
+        self.nodes += 1
+        if self.nodes & 255 == 0 and self._out_of_time():
+            self.stopped = True
+        if self.stopped or ply >= self.MAX_PLY:
+            return 0
+
+        opponent = 'red' if color == 'black' else 'black'
+
+        # In check near the horizon: every evasion must be tried, no standing pat
+        if qply < self.quiescence_check_plies and self.rules.is_in_check(self.board, color):
+            best_score = -self.MATE_SCORE + ply
+            for move in self._ordered_moves(color):
+                captured = self._make(move)
+                if self.rules.is_in_check(self.board, color):
+                    self._unmake(move, captured)
+                    continue
+                score = -self.quiesce(-beta, -alpha, opponent, ply + 1, qply + 1)
+                self._unmake(move, captured)
+                if score > best_score:
+                    best_score = score
+                if score > alpha:
+                    alpha = score
+                if alpha >= beta:
+                    break
+            return best_score
+
+        # Stand pat: the side to move can usually do at least as well as the static score
+        stand_pat = self.evaluate(color)
+        if stand_pat >= beta:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+
+        for move in self._ordered_moves(color, captures_only=True):
+            # Delta pruning: skip captures that can't lift the score back to alpha
+            to_pos = move[1]
+            captured_value = BoardRules.PIECE_VALUES[self.board[to_pos[0]][to_pos[1]][1]]
+            if stand_pat + captured_value + self.DELTA_MARGIN <= alpha:
+                continue
+            # SEE pruning: captures that lose the exchange won't improve a quiet position
+            if self._is_losing_capture(move):
+                continue
+
+            captured = self._make(move)
+            if self.rules.is_in_check(self.board, color):
+                self._unmake(move, captured)
+                continue
+            score = -self.quiesce(-beta, -alpha, opponent, ply + 1, qply + 1)
+            self._unmake(move, captured)
+
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+
+        return alpha
+
+    def _out_of_time(self):
+        """Check the deadline, and whether another thread has cancelled the search"""
+        return time.time() > self.deadline or (self.stop_event is not None and self.stop_event.is_set())
+
+    def _tablebase_score(self, color, ply):
+        """Mate-distance score for color from the endgame tables, or None if not covered"""
+        result = self.tablebases.probe(self.board, color)
+        if result is None:
+            return None
+        outcome, plies = result
+        if outcome > 0:
+            return self.MATE_SCORE - ply - plies
+        if outcome < 0:
+            return -self.MATE_SCORE + ply + plies
+        return 0
+
+    def _score_to_tt(self, score, ply):
+        """Store mate scores as distance from this node rather than from the root"""
+        if score > self.MATE_BOUND:
+            return score + ply
+        if score < -self.MATE_BOUND:
+            return score - ply
+        return score
+
+    def _score_from_tt(self, score, ply):
+        if score > self.MATE_BOUND:
+            return score - ply
+        if score < -self.MATE_BOUND:
+            return score + ply
+        return score
+
+    def evaluate(self, color):
+        """Material and piece-square score from color's point of view (kept up to date by _make)"""
+        return self.score if color == 'red' else -self.score
+
+    def _ordered_moves(self, color, tt_move=None, captures_only=False, ply=None):
+        """
+        Pseudo-legal moves for color in search order: the table move, captures
+        by MVV-LVA, the two killers for this ply, the countermove to the
+        previous move, then quiet moves by history score.
+        """
+        side = color[0].upper()
+        moves = []
+        for row in range(10):
+            for col in range(9):
+                piece = self.board[row][col]
+                if piece and piece[0] == side:
+                    for to_pos in self.rules.piece_moves(self.board, (row, col), captures_only):
+                        moves.append(((row, col), to_pos))
+
+        if ply is None:
+            self._sort_killers = (None, None)
+            self._sort_countermove = None
+        else:
+            self._sort_killers = self.killers[ply]
+            self._sort_countermove = None
+            if self.move_stack and self.move_stack[-1]:
+                (from_row, from_col), (to_row, to_col) = self.move_stack[-1]
+                self._sort_countermove = self.countermoves[from_row * 9 + from_col][to_row * 9 + to_col]
+        moves.sort(key=self._move_sorting_score, reverse=True)
+
+        if tt_move in moves:
+            moves.remove(tt_move)
+            moves.insert(0, tt_move)
+        return moves
+
+    def _move_sorting_score(self, move):
+        """Ordering score for one move (see _ordered_moves)"""
+        from_pos, to_pos = move
+        target_piece = self.board[to_pos[0]][to_pos[1]]
+        if target_piece:
+            # Most valuable victim first, cheapest attacker breaks ties;
+            # captures that lose material in the exchange go after quiet moves
+            moving_piece = self.board[from_pos[0]][from_pos[1]]
+            mvv_lva = BoardRules.PIECE_VALUES[target_piece[1]] * 10 - BoardRules.PIECE_VALUES[moving_piece[1]]
+            if self._is_losing_capture(move):
+                return -10000000 + mvv_lva
+            return 10000000 + mvv_lva
+        if move == self._sort_killers[0]:
+            return 9000000
+        if move == self._sort_killers[1]:
+            return 8000000
+        if move == self._sort_countermove:
+            return 7000000
+        return self.history[from_pos[0] * 9 + from_pos[1]][to_pos[0] * 9 + to_pos[1]]
+
+    def _is_losing_capture(self, move):
+        """Check if a capture loses material by SEE (cheap shortcut when the victim is worth more)"""
+        (from_row, from_col), (to_row, to_col) = move
+        moving_piece = self.board[from_row][from_col]
+        if moving_piece[1] in ('帥', '將'):
+            return False
+        victim_value = BoardRules.PIECE_VALUES[self.board[to_row][to_col][1]]
+        if victim_value >= BoardRules.PIECE_VALUES[moving_piece[1]]:
+            return False
+        return self.rules.static_exchange(self.board, move) < 0
+
+    def _record_quiet_cutoff(self, move, depth, ply):
+        """Remember a quiet move that caused a beta cutoff"""
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+
+        from_index = move[0][0] * 9 + move[0][1]
+        to_index = move[1][0] * 9 + move[1][1]
+        self.history[from_index][to_index] += depth * depth
+        if self.history[from_index][to_index] > 1000000:
+            # Keep history below the killer scores by halving the whole table
+            for row in self.history:
+                for i in range(90):
+                    row[i] //= 2
+
+        if self.move_stack and self.move_stack[-1]:
+            # The move has been unmade, so the top of the stack is the move it answers
+            (from_row, from_col), (to_row, to_col) = self.move_stack[-1]
+            self.countermoves[from_row * 9 + from_col][to_row * 9 + to_col] = move
+
+    def _count_attackers(self, color):
+        """Number of chariots, horses and cannons color has left"""
+        side = color[0].upper()
+        count = 0
+        for row in self.board:
+            for piece in row:
+                if piece and piece[0] == side and piece[1] in ('車', '馬', '炮'):
+                    count += 1
+        return count
+
+    def _make_null(self):
+        """Pass the turn (for null-move pruning)"""
+        self.hash_stack.append(self.hash)
+        self.hash ^= BoardRules.ZOBRIST_BLACK_TO_MOVE
+        self.move_stack.append(None)
+        self.score_stack.append(self.score)
+
+    def _unmake_null(self):
+        self.hash = self.hash_stack.pop()
+        self.move_stack.pop()
+        self.score = self.score_stack.pop()
+
+    def _make(self, move):
+        """Make a move on self.board, updating the position key; returns the captured piece"""
+        (from_row, from_col), (to_row, to_col) = move
+        piece = self.board[from_row][from_col]
+        captured = self.board[to_row][to_col]
+        zobrist = BoardRules.ZOBRIST
+
+        self.hash_stack.append(self.hash)
+        key = self.hash ^ BoardRules.ZOBRIST_BLACK_TO_MOVE
+        key ^= zobrist[piece][from_row * 9 + from_col] ^ zobrist[piece][to_row * 9 + to_col]
+        if captured:
+            key ^= zobrist[captured][to_row * 9 + to_col]
+        self.hash = key
+        self.move_stack.append(move)
+        self.score_stack.append(self.score)
+        self.score += self.evaluator.move_delta(move, piece, captured)
+        if captured:
+            self.piece_count -= 1
+
+        self.board[to_row][to_col] = piece
+        self.board[from_row][from_col] = None
+        return captured
+
+    def _unmake(self, move, captured):
+        (from_row, from_col), (to_row, to_col) = move
+        self.board[from_row][from_col] = self.board[to_row][to_col]
+        self.board[to_row][to_col] = captured
+        if captured:
+            self.piece_count += 1
+        self.hash = self.hash_stack.pop()
+        self.move_stack.pop()
+        self.score = self.score_stack.pop()
+
+class LazySMP:
+    """
+    Parallel alpha-beta (Lazy SMP).
+    Helper processes run AlphaBeta on the same root, starting at staggered
+    depths, and all share one transposition table in shared memory. Nothing
+    else is coordinated: the helpers help only by filling the table. The
+    result with the deepest completed iteration wins, with the main
+    process's own search winning ties.
+    """
+
+    def __init__(self, game_state, workers=None, max_time=5.0, max_depth=32, tt_size_mb=64, tablebases=None,
+                 analysis_moves=0, stop_event=None):
+        self.board = [row[:] for row in game_state.board]
+        self.current_player = game_state.current_player
+        self.workers = workers or os.cpu_count() or 1
+        self.max_time = max_time
+        self.max_depth = max_depth
+        self.tt_size_mb = tt_size_mb
+        self.tablebases = tablebases
+        # Candidate moves to keep for analyze(); they're collected before the shared table is released
+        self.analysis_moves = analysis_moves
+        self.analysis = []
+        self.stop_event = stop_event    # Cancels the main search; helpers are terminated with it
+        self.search_stats = {}
+
+    # Helpers stop this long before the deadline, so their results are in before the main process collects them
+    RESULT_MARGIN = 0.1
+    # Helpers are never forked from this process: the UI runs searches from a worker thread, and
+    # forking a multi-threaded process can deadlock on locks other threads hold. A fork server
+    # (single-threaded) starts them fastest; 'spawn' is the fallback where there is none.
+    START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+    def make_move(self):
+        start_time = time.time()
+        deadline = start_time + self.max_time
+        helper_deadline = deadline - min(self.RESULT_MARGIN, self.max_time / 10)
+        num_buckets = max(1, int(self.tt_size_mb * 1024 * 1024) // TranspositionTable.BUCKET_BYTES)
+        shm = shared_memory.SharedMemory(create=True, size=num_buckets * TranspositionTable.BUCKET_BYTES)
+        context = multiprocessing.get_context(self.START_METHOD)
+        results = context.Queue()
+        helpers = []
+        table = None
+        try:
+            for worker_id in range(1, self.workers):
+                helper = context.Process(
+                    target=LazySMP._helper_search,
+                    args=(shm.name, self.tt_size_mb, self.board, self.current_player,
+                          helper_deadline, self.max_depth, worker_id, results,
+                          self.tablebases.directory if self.tablebases else None),
+                    daemon=True
+                )
+                helper.start()
+                helpers.append(helper)
+
+            # The main process searches too, as worker 0, in what is left of the budget after spawning
+            table = TranspositionTable(size_mb=self.tt_size_mb, buffer=shm.buf)
+            engine = AlphaBeta(GameState(self.board, self.current_player),
+                               max_time=max(0.0, deadline - time.time()), max_depth=self.max_depth,
+                               transposition_table=table, tablebases=self.tablebases,
+                               stop_event=self.stop_event)
+            best_move = engine.make_move()
+            best_depth = engine.search_stats['depth']
+            best_score = engine.search_stats['score']
+            best_worker = 0
+            total_nodes = engine.search_stats['nodes']
+
+            # Collect the helpers' results that are in by the deadline
+            for _ in helpers:
+                if self.stop_event is not None and self.stop_event.is_set():
+                    break  # Cancelled: nobody is waiting for the move
+                try:
+                    worker_id, move, depth, score, nodes = results.get(timeout=max(0.0, deadline - time.time()))
+                except queue.Empty:
+                    break
+                total_nodes += nodes
+                if move is not None and depth > best_depth:
+                    best_move, best_depth, best_score, best_worker = move, depth, score, worker_id
+
+            # The analysis describes the main process's search, so it is only kept
+            # when that search's move is the one being played
+            self.analysis = []
+            if self.analysis_moves and best_worker == 0:
+                self.analysis = engine.analyze(self.analysis_moves)
+        finally:
+            # The table has to drop its view of shm.buf before the segment can be closed
+            if table is not None:
+                table.release()
+            # Helpers have had until the deadline; any still running (or still starting up) are stopped
+            for helper in helpers:
+                helper.join(timeout=max(0.0, deadline - time.time()))
+                if helper.is_alive():
+                    helper.terminate()
+                    helper.join(timeout=0.1)
+            shm.close()
+            shm.unlink()
+
+        elapsed = time.time() - start_time
+        self.search_stats = {
+            'workers': self.workers,
+            'depth': best_depth,
+            'score': best_score,
+            'best_worker': best_worker,
+            'nodes': total_nodes,
+            'time': elapsed,
+            'nps': total_nodes / elapsed if elapsed > 0 else 0,
+            'main': engine.search_stats
+        }
+        return best_move
+
+    def analyze(self, num_moves=3, pv_length=8):
+        """
+        Top root moves from the main process's search (see AlphaBeta.analyze),
+        limited to the analysis_moves collected during make_move. Empty when a
+        helper's deeper result was played instead, so the analysis never
+        disagrees with the move made
+        """
+        return [dict(entry, pv=entry['pv'][:pv_length]) for entry in self.analysis[:num_moves]]
+
+    @staticmethod
+    def _helper_search(shm_name, tt_size_mb, board, current_player, deadline, max_depth, worker_id, results,
+                       tablebase_dir=None):
+        """Body of a helper process: search the root until the deadline and report back"""
+        shm = shared_memory.SharedMemory(name=shm_name)
+        table = TranspositionTable(size_mb=tt_size_mb, buffer=shm.buf)
+        # Each helper maps the endgame tables itself
+        tablebases = EndgameTablebases(tablebase_dir) if tablebase_dir else None
+        try:
+            state = GameState(board, current_player)
+            engine = AlphaBeta(state, max_time=max(0.0, deadline - time.time()), max_depth=max_depth,
+                               transposition_table=table, start_depth=1 + worker_id % 2,
+                               tablebases=tablebases)
+            move = engine.make_move()
+            results.put((worker_id, move, engine.search_stats['depth'],
+                         engine.search_stats['score'], engine.search_stats['nodes']))
+        finally:
+            table.release()
+            shm.close()
+            if tablebases:
+                tablebases.close()
+
+class OpeningBook:
+
+    """
+    Opening book stored as a sorted binary file of fixed-size records
+    (position hash, move, weight, score). The file is memory-mapped and
+    probed by binary search, so startup cost doesn't depend on book size.
+    Positions are keyed by BoardRules.position_key with the side to move.
+    """
+
+    RECORD = struct.Struct('<QHHh2x')  # hash, from*90+to, weight, score (centipawns for the mover)
+
+    # Book lines played from the initial position, red first: (weight, score, moves).
+    # Mirrored lines are added when the book is built.
+    DEFAULT_LINES = [
+        # Central cannon against screen horses
+        (40, 10, [((7, 7), (7, 4)), ((0, 7), (2, 6)), ((9, 7), (7, 6)), ((0, 1), (2, 2)),
+                  ((9, 8), (9, 7)), ((0, 8), (0, 7))]),
+        # Central cannon against same-direction and opposite-direction cannons
+        (15, 15, [((7, 7), (7, 4)), ((2, 7), (2, 4)), ((9, 7), (7, 6)), ((0, 7), (2, 6))]),
+        (10, 15, [((7, 7), (7, 4)), ((2, 1), (2, 4)), ((9, 7), (7, 6)), ((0, 1), (2, 2))]),
+        # Pawn opening answered by the pawn-file cannon or the opposing pawn
+        (20, 5, [((6, 6), (5, 6)), ((2, 7), (2, 6)), ((7, 1), (7, 4)), ((0, 1), (2, 2))]),
+        (15, 0, [((6, 6), (5, 6)), ((3, 6), (4, 6)), ((9, 7), (7, 6)), ((0, 7), (2, 6))]),
+        # Elephant opening
+        (20, 0, [((9, 6), (7, 4)), ((3, 2), (4, 2)), ((9, 7), (7, 6)), ((0, 1), (2, 2))]),
+        (10, 0, [((9, 6), (7, 4)), ((0, 7), (2, 6)), ((9, 7), (7, 6)), ((3, 6), (4, 6))]),
+        # Horse opening
+        (15, 0, [((9, 7), (7, 6)), ((3, 6), (4, 6)), ((6, 6), (5, 6)), ((0, 7), (2, 6))]),
+    ]
+
+    def __init__(self, path, rules=None):
+        self.path = path
+        self.rules = rules or BoardRules()
+        self.file = None
+        self.data = None
+        self.num_records = 0
+        self.hits = 0
+        self.misses = 0
+
+        size = os.path.getsize(path)
+        if size >= self.RECORD.size:
+            self.file = open(path, 'rb')
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.num_records = size // self.RECORD.size
+
+    def close(self):
+        """Release the memory map and file handle"""
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.num_records = 0
+
+    def probe(self, key):
+        """
+        Look up every book entry for a position hash.
+
+        Returns:
+            list: (move, weight, score) tuples, empty if the position isn't in the book
+        """
+        record = self.RECORD
+        size = record.size
+        data = self.data
+
+        # Binary search for the first record with this key
+        low, high = 0, self.num_records
+        while low < high:
+            middle = (low + high) // 2
+            if record.unpack_from(data, middle * size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        entries = []
+        index = low
+        while index < self.num_records:
+            record_key, move_code, weight, score = record.unpack_from(data, index * size)
+            if record_key != key:
+                break
+            from_index, to_index = divmod(move_code, 90)
+            entries.append(((divmod(from_index, 9), divmod(to_index, 9)), weight, score))
+            index += 1
+
+        if entries:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return entries
+
+    def choose_move(self, board, color, rng=random):
+        """
+        Pick a weighted-random book move for the side to move.
+        Entries that aren't legal on this board (hash collisions) are ignored.
+
+        Returns:
+            tuple: (from_pos, to_pos), or None when out of book
+        """
+        if not self.num_records:
+            return None
+        entries = self.probe(self.rules.position_key(board, color))
+        if not entries:
+            return None
+        legal = set(self.rules.legal_moves(board, color))
+        entries = [(move, weight) for move, weight, _ in entries if move in legal and weight > 0]
+        if not entries:
+            return None
+        moves, weights = zip(*entries)
+        return rng.choices(moves, weights=weights)[0]
+
+    def stats(self):
+        """Return book size and probe counts"""
+        return {'records': self.num_records, 'hits': self.hits, 'misses': self.misses}
+
+    @classmethod
+    def build(cls, path, start_board, lines=None, mirror=True, rules=None):
+        """
+        Write a book file from move lines played out from start_board.
+
+        Args:
+            path: Output file
+            start_board: Initial position, red to move
+            lines: (weight, score, moves) tuples, defaults to DEFAULT_LINES
+            mirror: Also add each line reflected left to right
+        """
+        rules = rules or BoardRules()
+        lines = cls.DEFAULT_LINES if lines is None else lines
+        if mirror:
+            lines = list(lines) + [
+                (weight, score, [((fr, 8 - fc), (tr, 8 - tc)) for (fr, fc), (tr, tc) in moves])
+                for weight, score, moves in lines
+            ]
+
+        # Merge entries reached by more than one line
+        entries = {}
+        for weight, score, moves in lines:
+            board = [row[:] for row in start_board]
+            color = 'red'
+            for from_pos, to_pos in moves:
+                if (from_pos, to_pos) not in rules.legal_moves(board, color):
+                    raise ValueError(f"Illegal book move {from_pos}->{to_pos} for {color}")
+                move_code = (from_pos[0] * 9 + from_pos[1]) * 90 + to_pos[0] * 9 + to_pos[1]
+                entry = entries.setdefault((rules.position_key(board, color), move_code), [0, score])
+                entry[0] = min(entry[0] + weight, 0xFFFF)
+                board[to_pos[0]][to_pos[1]] = board[from_pos[0]][from_pos[1]]
+                board[from_pos[0]][from_pos[1]] = None
+                color = 'black' if color == 'red' else 'red'
+
+        with open(path, 'wb') as book_file:
+            for (key, move_code), (weight, score) in sorted(entries.items()):
+                book_file.write(cls.RECORD.pack(key, move_code, weight, score))
+        return len(entries)
+
+class EndgameTable:
+
+    """
+    Distance-to-mate table for one material set, one byte per position.
+    A position is indexed by the square of each piece, kings first, with each
+    piece limited to the squares it can ever stand on, plus the side to move.
+    Byte values: 0 draw, 1-127 the side to move mates in 2v-1 plies,
+    128-254 the side to move is mated in 2(v-128) plies, 255 illegal.
+    """
+
+    DRAW = 0
+    LOSS_BASE = 128
+    ILLEGAL = 255
+    HEADER = struct.Struct('<4s16s')   # magic, material name
+    MAGIC = b'XQTB'
+
+    KINGS = ('帥', '將')
+    LETTERS = {'帥': 'K', '將': 'K', '仕': 'A', '士': 'A', '相': 'B', '象': 'B',
+               '馬': 'N', '車': 'R', '炮': 'C', '兵': 'P', '卒': 'P'}
+
+    def __init__(self, pieces, data=None, offset=0):
+        self.pieces = self.canonical(pieces)
+        self.name = self.material_name(self.pieces)
+        self.domains = [self.piece_squares(piece) for piece in self.pieces]
+        self.slots = [{square: slot for slot, square in enumerate(domain)} for domain in self.domains]
+        # Mixed-radix index, side to move in the lowest bit
+        self.strides = []
+        size = 2
+        for domain in reversed(self.domains):
+            self.strides.insert(0, size)
+            size *= len(domain)
+        self.size = size
+        self.data = data
+        self.offset = offset
+        self.file = None
+
+    @classmethod
+    def canonical(cls, pieces):
+        """Piece list with both kings first, then the rest in BoardRules.PIECES order"""
+        pieces = [piece for piece in pieces if piece[1] not in cls.KINGS]
+        return ['R帥', 'B將'] + sorted(pieces, key=BoardRules.PIECES.index)
+
+    @classmethod
+    def material_name(cls, pieces):
+        """File name for a material set, e.g. 'KR_KAA' for chariot against two advisors"""
+        red = ''.join(cls.LETTERS[piece[1]] for piece in cls.canonical(pieces) if piece[0] == 'R')
+        black = ''.join(cls.LETTERS[piece[1]] for piece in cls.canonical(pieces) if piece[0] == 'B')
+        return f"{red}_{black}"
+
+    @staticmethod
+    def piece_squares(piece):
+        """Board indices (row * 9 + col) a piece can ever stand on"""
+        color, kind = piece
+        squares = []
+        for row in range(10):
+            # Work in red's orientation; black's squares are the mirrored rows
+            red_row = row if color == 'R' else 9 - row
+            for col in range(9):
+                if kind in ('帥', '將'):
+                    allowed = red_row >= 7 and 3 <= col <= 5
+                elif kind in ('仕', '士'):
+                    allowed = (red_row, col) in ((9, 3), (9, 5), (8, 4), (7, 3), (7, 5))
+                elif kind in ('相', '象'):
+                    allowed = (red_row, col) in ((9, 2), (9, 6), (7, 0), (7, 4), (7, 8), (5, 2), (5, 6))
+                elif kind in ('兵', '卒'):
+                    allowed = red_row <= 4 or (red_row <= 6 and col % 2 == 0)
+                else:
+                    allowed = True
+                if allowed:
+                    squares.append(row * 9 + col)
+        return squares
+
+    @classmethod
+    def open(cls, path):
+        """Memory-map a table file written by EndgameTablebases.generate"""
+        with open(path, 'rb') as table_file:
+            magic, name = cls.HEADER.unpack(table_file.read(cls.HEADER.size))
+        if magic != cls.MAGIC:
+            raise ValueError(f"Not an endgame table: {path}")
+        name = name.rstrip(b'\0').decode('ascii')
+        red, black = name.split('_')
+        pieces = ([piece for letter in red[1:] for piece in cls._pieces_for(letter, 'R')] +
+                  [piece for letter in black[1:] for piece in cls._pieces_for(letter, 'B')])
+        table_file = open(path, 'rb')
+        table = cls(pieces, mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ), cls.HEADER.size)
+        table.file = table_file
+        if len(table.data) != table.offset + table.size:
+            table.close()
+            raise ValueError(f"Endgame table {path} has the wrong size")
+        return table
+
+    @classmethod
+    def _pieces_for(cls, letter, color):
+        """Helper to map a name letter back to the piece of that color"""
+        return [piece for piece in BoardRules.PIECES
+                if piece[0] == color and cls.LETTERS[piece[1]] == letter][:1]
+
+    def close(self):
+        """Release the memory map and file handle"""
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.data = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def index(self, squares, color):
+        """Index of the position with these piece squares (in self.pieces order)"""
+        index = 0 if color == 'red' else 1
+        for slots, stride, square in zip(self.slots, self.strides, squares):
+            index += slots[square] * stride
+        return index
+
+    def decode(self, index):
+        """Piece squares and side to move for an index"""
+        squares = [domain[(index // stride) % len(domain)] for domain, stride in zip(self.domains, self.strides)]
+        return squares, ('red' if index & 1 == 0 else 'black')
+
+    def value(self, index):
+        """
+        Returns:
+            tuple: (outcome, plies) for the side to move, outcome 1 win / 0 draw / -1 loss,
+            or None for an illegal position
+        """
+        byte = self.data[self.offset + index]
+        if byte == self.ILLEGAL:
+            return None
+        if byte == self.DRAW:
+            return (0, 0)
+        if byte < self.LOSS_BASE:
+            return (1, 2 * byte - 1)
+        return (-1, 2 * (byte - self.LOSS_BASE))
+
+class EndgameTablebases:
+
+    """
+    Set of endgame tables in one directory, generated by retrograde analysis.
+    Tables are memory-mapped on load, so a probe is a board scan plus one
+    byte read. Each table also answers the same material with colors
+    swapped, by flipping the board. Generate tables offline, e.g.
+    EndgameTablebases('tablebases').generate(['R車', 'B士', 'B士']).
+    """
+
+    MAX_PIECES = 5
+    FLIPPED_KINDS = {'帥': '將', '將': '帥', '仕': '士', '士': '仕',
+                     '相': '象', '象': '相', '兵': '卒', '卒': '兵'}
+
+    def __init__(self, directory, rules=None):
+        self.directory = directory
+        self.rules = rules or BoardRules()
+        self.tables = {}
+        self.max_pieces = 0     # Largest piece count any loaded table covers
+        self.probes = 0
+        self.hits = 0
+
+        if os.path.isdir(directory):
+            for file_name in sorted(os.listdir(directory)):
+                if file_name.endswith('.dtm'):
+                    self._add(EndgameTable.open(os.path.join(directory, file_name)))
+
+    def _add(self, table):
+        """Helper to register a table under its material name"""
+        self.tables[table.name] = table
+        self.max_pieces = max(self.max_pieces, len(table.pieces))
+
+    def close(self):
+        """Close every loaded table"""
+        for table in self.tables.values():
+            table.close()
+        self.tables = {}
+        self.max_pieces = 0
+
+    def _flip_piece(self, piece):
+        """Helper to swap a piece's color"""
+        return ('B' if piece[0] == 'R' else 'R') + self.FLIPPED_KINDS.get(piece[1], piece[1])
+
+    def probe(self, board, color):
+        """
+        Look up a position.
+
+        Returns:
+            tuple: (outcome, plies) for color, outcome 1 win / 0 draw / -1 loss,
+            or None when no table covers the material or a king is missing
+        """
+        self.probes += 1
+        found = {}
+        count = 0
+        for row in range(10):
+            board_row = board[row]
+            for col in range(9):
+                piece = board_row[col]
+                if piece:
+                    count += 1
+                    if count > self.max_pieces:
+                        return None
+                    found.setdefault(piece, []).append(row * 9 + col)
+
+        # Every table has exactly one king a side; search trees can reach positions without one
+        if len(found.get('R帥', ())) != 1 or len(found.get('B將', ())) != 1:
+            return None
+
+        pieces = [piece for piece, squares in found.items() for _ in squares]
+        table = self.tables.get(EndgameTable.material_name(pieces))
+        if table is None:
+            # Same material with colors swapped: mirror the board top to bottom
+            table = self.tables.get(EndgameTable.material_name([self._flip_piece(piece) for piece in pieces]))
+            if table is None:
+                return None
+            found = {self._flip_piece(piece): [(9 - square // 9) * 9 + square % 9 for square in squares]
+                     for piece, squares in found.items()}
+            color = 'red' if color == 'black' else 'black'
+
+        # The name only tells the material apart up to the kings, so check the full piece list
+        if sorted(piece for piece, squares in found.items() for _ in squares) != sorted(table.pieces):
+            return None
+
+        # Identical pieces (two advisors, say) can fill their slots in either order
+        remaining = {piece: sorted(squares) for piece, squares in found.items()}
+        squares = [remaining[piece].pop() for piece in table.pieces]
+        result = table.value(table.index(squares, color))
+        if result is not None:
+            self.hits += 1
+        return result
+
+    def best_move(self, board, color):
+        """
+        Tablebase move: the quickest win, else a draw, else the slowest loss.
+        Returns None if any reply's material isn't covered.
+        """
+        opponent = 'red' if color == 'black' else 'black'
+        best_move = None
+        best_key = None
+        for move in self.rules.legal_moves(board, color):
+            (from_row, from_col), (to_row, to_col) = move
+            piece, captured = board[from_row][from_col], board[to_row][to_col]
+            board[to_row][to_col] = piece
+            board[from_row][from_col] = None
+            result = self.probe(board, opponent)
+            board[from_row][from_col] = piece
+            board[to_row][to_col] = captured
+            if result is None:
+                return None
+
+            # Results are from the opponent's side: their loss is our win
+            outcome, plies = result
+            key = (-outcome, -plies if outcome < 0 else plies)
+            if best_key is None or key > best_key:
+                best_key = key
+                best_move = move
+        return best_move
+
+    def stats(self):
+        """Return loaded tables and probe counts"""
+        return {
+            'tables': sorted(self.tables),
+            'max_pieces': self.max_pieces,
+            'probes': self.probes,
+            'hits': self.hits,
+            'hit_rate': self.hits / self.probes if self.probes else 0.0
+        }
+
+    def generate(self, pieces):
+        """
+        Build a table by retrograde analysis and write it to the directory.
+        Tables for every material a capture can lead to are generated first.
+
+        Args:
+            pieces: Pieces besides the two kings, e.g. ['R車', 'B士', 'B士']
+
+        Returns:
+            EndgameTable: the memory-mapped table
+        """
+        table = EndgameTable(pieces)
+        if len(table.pieces) > self.MAX_PIECES:
+            raise ValueError(f"At most {self.MAX_PIECES} pieces are supported, got {len(table.pieces)}")
+        flipped_name = EndgameTable.material_name([self._flip_piece(piece) for piece in table.pieces])
+        if table.name in self.tables:
+            return self.tables[table.name]
+        if flipped_name in self.tables:
+            return self.tables[flipped_name]
+
+        # Captures lead to this material minus one non-king piece
+        for i, piece in enumerate(table.pieces):
+            if piece[1] not in EndgameTable.KINGS:
+                self.generate(table.pieces[:i] + table.pieces[i + 1:])
+
+        values = self._retrograde(table)
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, table.name + '.dtm')
+        with open(path, 'wb') as table_file:
+            table_file.write(EndgameTable.HEADER.pack(EndgameTable.MAGIC, table.name.encode('ascii')))
+            table_file.write(values)
+        table = EndgameTable.open(path)
+        self._add(table)
+        return table
+
+    def _retrograde(self, table):
+        """
+        Solve every position of a table.
+        One forward pass generates each position's moves: captures are scored
+        from the smaller tables and quiet moves are recorded as predecessor
+        links. Results are then propagated backwards in order of distance to
+        mate, so each win is found at its shortest distance. Positions never
+        resolved are draws (in Xiangqi a side without legal moves has lost).
+        """
+        rules = self.rules
+        size = table.size
+        num_pieces = len(table.pieces)
+        values = bytearray([EndgameTable.ILLEGAL]) * size
+        remaining = array.array('H', [0]) * size    # Moves not yet known to lose
+        longest = array.array('H', [0]) * size      # Plies to mate through the slowest losing move
+        quiet_children = array.array('i')
+        quiet_parents = array.array('i')
+        pending = defaultdict(list)                 # plies -> [(index, is_win)]
+        board = [[None] * 9 for _ in range(10)]
+
+        for index in range(size):
+            squares, color = table.decode(index)
+            if len(set(squares)) < num_pieces:
+                continue
+            for piece, square in zip(table.pieces, squares):
+                board[square // 9][square % 9] = piece
+            opponent = 'red' if color == 'black' else 'black'
+
+            # The side that just moved can't be left in check
+            if not rules.is_in_check(board, opponent):
+                values[index] = EndgameTable.DRAW
+                moves = rules.legal_moves(board, color)
+                remaining[index] = len(moves)
+                piece_at = {square: i for i, square in enumerate(squares)}
+                for move in moves:
+                    (from_row, from_col), (to_row, to_col) = move
+                    if board[to_row][to_col]:
+                        # Capture: the result comes from a smaller table
+                        piece, captured = board[from_row][from_col], board[to_row][to_col]
+                        board[to_row][to_col] = piece
+                        board[from_row][from_col] = None
+                        outcome, plies = self.probe(board, opponent)
+                        board[from_row][from_col] = piece
+                        board[to_row][to_col] = captured
+                        if outcome < 0:
+                            pending[plies + 1].append((index, True))
+                        elif outcome > 0:
+                            remaining[index] -= 1
+                            longest[index] = max(longest[index], plies + 1)
+                    else:
+                        moved = piece_at[from_row * 9 + from_col]
+                        stride = table.strides[moved]
+                        child = (index ^ 1) + (table.slots[moved][to_row * 9 + to_col]
+                                               - table.slots[moved][from_row * 9 + from_col]) * stride
+                        quiet_children.append(child)
+                        quiet_parents.append(index)
+                if remaining[index] == 0:
+                    pending[longest[index]].append((index, False))
+
+            for square in squares:
+                board[square // 9][square % 9] = None
+
+        # Group the predecessor links by child position
+        starts = array.array('i', [0]) * (size + 1)
+        for child in quiet_children:
+            starts[child + 1] += 1
+        for i in range(size):
+            starts[i + 1] += starts[i]
+        fill = array.array('i', starts)
+        parents = array.array('i', [0]) * len(quiet_children)
+        for child, parent in zip(quiet_children, quiet_parents):
+            parents[fill[child]] = parent
+            fill[child] += 1
+        del quiet_children, quiet_parents, fill
+
+        resolved = bytearray(size)
+        while pending:
+            plies = min(pending)
+            if plies > 2 * (EndgameTable.ILLEGAL - 1 - EndgameTable.LOSS_BASE):
+                raise ValueError(f"Distance to mate {plies} doesn't fit in a table byte")
+            for index, is_win in pending.pop(plies):
+                if resolved[index]:
+                    continue
+                resolved[index] = 1
+                if is_win:
+                    values[index] = (plies + 1) // 2
+                else:
+                    values[index] = EndgameTable.LOSS_BASE + plies // 2
+
+                for k in range(starts[index], starts[index + 1]):
+                    parent = parents[k]
+                    if resolved[parent]:
+                        continue
+                    if not is_win:
+                        # Moving into a lost position wins
+                        pending[plies + 1].append((parent, True))
+                    else:
+                        remaining[parent] -= 1
+                        longest[parent] = max(longest[parent], plies + 1)
+                        if remaining[parent] == 0:
+                            pending[longest[parent]].append((parent, False))
+        return values
+
+class MoveHistory:
+
+    """
+    Moves of one game, packed as one 32-bit record per ply (from square,
+    to square, moved piece, captured piece), with a 90-byte board checkpoint
+    every checkpoint_interval plies. The board at any ply is rebuilt from
+    the nearest checkpoint by playing or taking back at most half an
+    interval of moves.
+    """
+
+    # Piece codes for records and checkpoints; 0 is an empty square
+    PIECE_CODES = {piece: code for code, piece in enumerate(BoardRules.PIECES, 1)}
+    CODE_PIECES = [None] + BoardRules.PIECES
+
+    def __init__(self, initial_board, checkpoint_interval=16):
+        self.checkpoint_interval = checkpoint_interval
+        self.records = array.array('I')
+        self.checkpoints = [self._pack_board(initial_board)]
+
+    def __len__(self):
+        return len(self.records)
+
+    def copy(self):
+        """Copy of the history; checkpoints are immutable bytes, so only the lists are copied"""
+        history = MoveHistory.__new__(MoveHistory)
+        history.checkpoint_interval = self.checkpoint_interval
+        history.records = array.array('I', self.records)
+        history.checkpoints = list(self.checkpoints)
+        return history
+
+    def __getitem__(self, index):
+        """Move record for a ply: (from_pos, to_pos, piece, captured)"""
+        record = self.records[index]
+        return (divmod(record & 0x7F, 9), divmod((record >> 7) & 0x7F, 9),
+                self.CODE_PIECES[(record >> 14) & 0xF], self.CODE_PIECES[(record >> 18) & 0xF])
+
+    def _pack_board(self, board):
+        """Helper to store a board as 90 piece codes"""
+        return bytes(self.PIECE_CODES[piece] if piece else 0 for row in board for piece in row)
+
+    def append(self, from_pos, to_pos, piece, captured=None):
+        """Record a move, adding a checkpoint when one is due"""
+        self.records.append((from_pos[0] * 9 + from_pos[1]) | (to_pos[0] * 9 + to_pos[1]) << 7 |
+                            self.PIECE_CODES[piece] << 14 | (self.PIECE_CODES[captured] if captured else 0) << 18)
+        if len(self.records) % self.checkpoint_interval == 0:
+            self.checkpoints.append(self._pack_board(self.board_at(len(self.records))))
+
+    def apply_move(self, board, index):
+        """Play move number index on board (which must show the position before it)"""
+        from_pos, to_pos, piece, _ = self[index]
+        board[to_pos[0]][to_pos[1]] = piece
+        board[from_pos[0]][from_pos[1]] = None
+
+    def unapply_move(self, board, index):
+        """Take back move number index on board (which must show the position after it)"""
+        from_pos, to_pos, piece, captured = self[index]
+        board[from_pos[0]][from_pos[1]] = piece
+        board[to_pos[0]][to_pos[1]] = captured
+
+    def board_at(self, ply):
+        """New board showing the position after the first ply moves (0 = the initial position)"""
+        interval = self.checkpoint_interval
+        checkpoint = min((ply + interval // 2) // interval, len(self.checkpoints) - 1)
+        packed = self.checkpoints[checkpoint]
+        board = [[self.CODE_PIECES[code] for code in packed[row * 9:row * 9 + 9]] for row in range(10)]
+        for index in range(checkpoint * interval, ply):
+            self.apply_move(board, index)
+        for index in range(checkpoint * interval - 1, ply - 1, -1):
+            self.unapply_move(board, index)
+        return board
+
+class GameState:
+
+    """
+    Headless game state shared by the engines and the UI: the board, the
+    side to move, the move history and whether the game is over. Cloning
+    copies ten board rows and the packed history, so it takes microseconds
+    and never touches Tk or pygame.
+    """
+
+    __slots__ = ('board', 'current_player', 'history', 'game_over')
+
+    def __init__(self, board=None, current_player='red', history=None, game_over=False):
+        self.board = board if board is not None else [[None for _ in range(9)] for _ in range(10)]
+        self.current_player = current_player
+        self.history = history
+        self.game_over = game_over
+
+    def clone(self):
+        """Independent copy: changes to either board or history don't affect the other"""
+        return GameState([row[:] for row in self.board], self.current_player,
+                         self.history.copy() if self.history is not None else None, self.game_over)
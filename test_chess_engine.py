@@ -0,0 +1,63 @@
+import random
+import tempfile
+import unittest
+
+from chess_engine import AlphaBeta, EndgameTable, EndgameTablebases, GameState, MCTS
+
+
+class EndgameTablebasesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.tablebases = EndgameTablebases(self.directory.name)
+        # All-draw tables are enough to exercise how positions are matched to tables
+        # (none covers the five-piece test position, so MCTS has to search it)
+        for pieces in ([], ['R車'], ['B士'], ['B車'], ['R車', 'B士'], ['R車', 'B車'], ['B士', 'B車']):
+            table = EndgameTable(pieces)
+            table.data = bytes(table.size)
+            self.tablebases._add(table)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def board(self, pieces):
+        board = [[None for _ in range(9)] for _ in range(10)]
+        for (row, col), piece in pieces.items():
+            board[row][col] = piece
+        return board
+
+    def test_probe_covered_material(self):
+        board = self.board({(0, 4): 'B將', (9, 3): 'R帥', (4, 0): 'R車'})
+        self.assertEqual(self.tablebases.probe(board, 'red')[0], 0)
+
+    def test_probe_without_a_king(self):
+        # The material alone would name the KR_K table
+        no_red_king = self.board({(0, 4): 'B將', (4, 0): 'R車'})
+        no_black_king = self.board({(9, 3): 'R帥', (4, 0): 'R車', (1, 4): 'B士'})
+        self.assertIsNone(self.tablebases.probe(no_red_king, 'red'))
+        self.assertIsNone(self.tablebases.probe(no_black_king, 'black'))
+
+    def test_mcts_reaches_kingless_positions(self):
+        # Tree moves don't check king safety, so the search captures kings here
+        board = self.board({(0, 4): 'B將', (1, 4): 'B士', (9, 3): 'R帥', (4, 0): 'R車', (2, 8): 'B車'})
+        random.seed(1)
+        move = MCTS(GameState(board, 'red'), simulation_limit=300, tablebases=self.tablebases).make_move()
+        self.assertIsNotNone(move)
+
+
+class AlphaBetaTest(unittest.TestCase):
+
+    def test_long_tablebase_mates_keep_their_distance_in_the_tt(self):
+        board = [[None for _ in range(9)] for _ in range(10)]
+        board[0][4], board[9][3] = 'B將', 'R帥'
+        engine = AlphaBeta(GameState(board, 'red'))
+        # Mate in 250 plies found 3 plies from the root, well past MAX_PLY
+        for score in (engine.MATE_SCORE - 3 - 250, -engine.MATE_SCORE + 3 + 250):
+            stored = engine._score_to_tt(score, 3)
+            # The same position reached 7 plies from the root is 4 plies further from mate
+            shift = 4 if score > 0 else -4
+            self.assertEqual(engine._score_from_tt(stored, 7), score - shift)
+
+
+if __name__ == '__main__':
+    unittest.main()